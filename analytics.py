@@ -0,0 +1,317 @@
+import math
+from sqlalchemy import case, func, select
+from models import db, Course, Section, Enrollment
+from pagination import DEFAULT_PAGE_SIZE
+
+# NumPy is imported inside the functions that use it: it is the slowest
+# import in the app and only the analytics views need it, so workers and
+# CLI commands that never compute a GPA do not pay for it at startup.
+
+# Standard 4.0 scale. Anything else (W, I, P, blank, typos) counts as ungraded
+# and is left out of GPAs but still shows up in histograms.
+GRADE_POINTS = [
+    ('A+', 4.0), ('A', 4.0), ('A-', 3.7),
+    ('B+', 3.3), ('B', 3.0), ('B-', 2.7),
+    ('C+', 2.3), ('C', 2.0), ('C-', 1.7),
+    ('D+', 1.3), ('D', 1.0), ('D-', 0.7),
+    ('F', 0.0),
+]
+GRADES = [grade for grade, _ in GRADE_POINTS]
+UNGRADED = len(GRADES)
+# Indexed by grade code; the extra NaN slot is the ungraded code
+POINTS = [points for _, points in GRADE_POINTS] + [math.nan]
+
+SEMESTER_CODES = {'Spring': 1, 'Summer': 2, 'Fall': 3}
+SEMESTER_NAMES = {code: name for name, code in SEMESTER_CODES.items()}
+
+DEFAULT_CHUNK_SIZE = 200000
+
+
+def grade_code(column):
+    """SQL expression mapping a free-text grade to its small-integer code"""
+    return case({grade: code for code, grade in enumerate(GRADES)},
+                value=func.upper(func.trim(column)), else_=UNGRADED)
+
+
+def grade_points(column):
+    """SQL expression for a grade's point value, NULL when ungraded"""
+    return case({grade: points for grade, points in GRADE_POINTS},
+                value=func.upper(func.trim(column)), else_=None)
+
+
+# Terms are packed into one integer (year * 10 + semester code) so they group like any other key
+TERM_KEY = Section.year * 10 + case(SEMESTER_CODES, value=Section.semester, else_=0)
+
+DIMENSIONS = {
+    'student': Enrollment.student_number,
+    'section': Enrollment.section_identifier,
+    'course': Section.course_number,
+    'instructor': Section.instructor_name,
+    'term': TERM_KEY,
+}
+# Dimensions keyed by an enrollment column, so a page can scan only its own rows
+SCAN_PAGED = {'student', 'section'}
+
+
+def term_label(key):
+    year, code = divmod(int(key), 10)
+    return f'{SEMESTER_NAMES.get(code, "Other")} {year}'
+
+
+def parse_term(label):
+    """'Fall 2024' -> packed term key"""
+    semester, _, year = label.strip().rpartition(' ')
+    return int(year) * 10 + SEMESTER_CODES.get(semester, 0)
+
+
+def parse_key(dimension, raw):
+    """Convert a ?key= value to the type stored for `dimension`; raises ValueError"""
+    if dimension == 'instructor':
+        return raw
+    if dimension == 'term':
+        return parse_term(raw)
+    return int(raw)
+
+
+def _label(dimension, key):
+    if dimension == 'term':
+        return term_label(key)
+    if dimension == 'instructor':
+        return str(key)
+    return int(key)
+
+
+def fetch_chunks(stmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Run `stmt` on the raw DBAPI cursor and yield lists of at most `chunk_size` row tuples
+
+    Skipping SQLAlchemy's Row objects more than halves the cost of a full
+    scan. On Postgres a named (server-side) cursor keeps the result out of
+    client memory.
+    """
+    conn = db.session.connection()
+    # Expand IN lists into plain parameters, since the DBAPI cursor can't
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if conn.dialect.name == 'postgresql':
+        cursor = conn.connection.driver_connection.cursor(name='analytics_scan')
+    else:
+        cursor = conn.connection.cursor()
+    try:
+        cursor.execute(str(compiled), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+class SectionLookup:
+    """Per-section attributes as NumPy arrays indexed by section_identifier
+
+    Sections and courses are small next to enrollments, so loading them once
+    lets the enrollment scan skip both joins: credits, course, term and
+    instructor for each row become array lookups.
+    """
+
+    def __init__(self):
+        import numpy as np
+        rows = db.session.execute(
+            select(Section.section_identifier, func.coalesce(Course.credit_hours, 0),
+                   Section.course_number, TERM_KEY, Section.instructor_name)
+            .join(Course, Section.course_number == Course.course_number)
+        ).all()
+        size = max((row[0] for row in rows), default=0) + 1
+        self.known = np.zeros(size, dtype=bool)
+        self.credits = np.zeros(size, dtype=np.float64)
+        self.course = np.full(size, -1, dtype=np.int64)
+        self.term = np.full(size, -1, dtype=np.int64)
+        self.instructor = np.full(size, -1, dtype=np.int64)
+        self.instructor_names = sorted({row[4] for row in rows if row[4] is not None})
+        codes = {name: code for code, name in enumerate(self.instructor_names)}
+        for section, credits, course, term, instructor in rows:
+            self.known[section] = True
+            self.credits[section] = credits
+            self.course[section] = course
+            if term is not None:
+                self.term[section] = term
+            self.instructor[section] = codes.get(instructor, -1)
+
+    def keys(self, dimension, students, sections):
+        """Group keys for a chunk; -1 marks rows with no key for that dimension"""
+        if dimension == 'student':
+            return students
+        if dimension == 'section':
+            return sections
+        return getattr(self, dimension)[sections]
+
+    def label(self, dimension, key):
+        if dimension == 'instructor':
+            return self.instructor_names[key]
+        return _label(dimension, key)
+
+
+def _key_filter(dimension, key):
+    if dimension == 'student':
+        return Enrollment.student_number == key
+    if dimension == 'section':
+        return Enrollment.section_identifier == key
+    return Enrollment.section_identifier.in_(
+        select(Section.section_identifier).where(DIMENSIONS[dimension] == key))
+
+
+def iter_chunks(dimension=None, key=None, chunk_size=DEFAULT_CHUNK_SIZE, keys=None):
+    """Scan enrollments and yield (lookup, students, sections, codes) per chunk
+
+    Rows whose section has no course are dropped, matching an inner join.
+    `keys` limits a SCAN_PAGED dimension to a list of keys.
+    """
+    import numpy as np
+    lookup = SectionLookup()
+    stmt = (
+        select(Enrollment.student_number, Enrollment.section_identifier, grade_code(Enrollment.grade))
+        .where(Enrollment.student_number.isnot(None), Enrollment.section_identifier.isnot(None))
+    )
+    if key is not None:
+        stmt = stmt.where(_key_filter(dimension, key))
+    if keys is not None:
+        stmt = stmt.where(DIMENSIONS[dimension].in_(keys))
+    for rows in fetch_chunks(stmt, chunk_size):
+        students, sections, codes = (np.fromiter(column, np.int64, len(rows)) for column in zip(*rows))
+        in_range = sections < len(lookup.known)
+        sections = np.where(in_range, sections, 0)
+        valid = in_range & lookup.known[sections]
+        yield lookup, students[valid], sections[valid], codes[valid]
+
+
+class GroupTotals:
+    """Running per-key sums, merged chunk by chunk
+
+    Each chunk is reduced to one row per distinct key. The partial results
+    are folded together whenever they outgrow `compact_at`, so memory is
+    bounded by the number of groups rather than the number of rows.
+    """
+
+    def __init__(self, compact_at=DEFAULT_CHUNK_SIZE):
+        self.compact_at = compact_at
+        self._parts = []
+        self._size = 0
+
+    @staticmethod
+    def _reduce(keys, *values):
+        import numpy as np
+        unique, inverse = np.unique(keys, return_inverse=True)
+        return (unique,) + tuple(np.bincount(inverse, weights=v, minlength=len(unique)) for v in values)
+
+    def add(self, keys, *values):
+        if len(keys):
+            part = self._reduce(keys, *values)
+            self._parts.append(part)
+            self._size += len(part[0])
+        if self._size > self.compact_at and len(self._parts) > 1:
+            self._compact()
+
+    def _compact(self):
+        import numpy as np
+        columns = list(zip(*self._parts))
+        self._parts = [self._reduce(*(np.concatenate(column) for column in columns))]
+        self._size = len(self._parts[0][0])
+
+    def result(self):
+        if not self._parts:
+            return None
+        if len(self._parts) > 1:
+            self._compact()
+        return self._parts[0]
+
+
+def gpa_by(dimension, key=None, chunk_size=DEFAULT_CHUNK_SIZE, keys=None):
+    """Credit-weighted GPA per `dimension` key, computed in NumPy chunk by chunk
+
+    Returns a list of {'key', 'gpa', 'credits', 'enrollments'} dicts ordered by key.
+    """
+    import numpy as np
+    points_table = np.array(POINTS)
+    totals = GroupTotals(compact_at=chunk_size)
+    lookup = None
+    for lookup, students, sections, codes in iter_chunks(dimension, key, chunk_size, keys):
+        points = points_table[codes]
+        keys = lookup.keys(dimension, students, sections)
+        keep = ~np.isnan(points) & (keys != -1)
+        credits = lookup.credits[sections[keep]]
+        totals.add(keys[keep], points[keep] * credits, credits, np.ones(int(keep.sum())))
+    result = totals.result()
+    if result is None:
+        return []
+    keys, quality, credits, counts = result
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gpas = quality / credits
+    return [
+        {'key': lookup.label(dimension, k), 'gpa': None if c == 0 else round(float(g), 3),
+         'credits': int(c), 'enrollments': int(n)}
+        for k, g, c, n in zip(keys.tolist(), gpas.tolist(), credits.tolist(), counts.tolist())
+    ]
+
+
+def gpa_page(dimension, after=None, limit=DEFAULT_PAGE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    """One keyset page of gpa_by(): at most `limit` groups with keys after `after`
+
+    Returns (groups, next_after), where next_after is the key to pass back
+    as ?after= or None on the last page. Student and section pages only scan
+    the enrollments of their own keys; the other dimensions have few groups
+    and are sliced from a full scan. Keys with no graded enrollments take
+    up a place in a page without appearing in it.
+    """
+    if dimension in SCAN_PAGED:
+        column = DIMENSIONS[dimension]
+        stmt = select(column).distinct().where(column.isnot(None)).order_by(column).limit(limit + 1)
+        if after is not None:
+            stmt = stmt.where(column > after)
+        keys = db.session.execute(stmt).scalars().all()
+        next_after = keys[limit - 1] if len(keys) > limit else None
+        groups = gpa_by(dimension, chunk_size=chunk_size, keys=keys[:limit]) if keys else []
+        return groups, next_after
+    groups = gpa_by(dimension, chunk_size=chunk_size)
+    if after is not None:
+        groups = [group for group in groups if parse_key(dimension, str(group['key'])) > after]
+    next_after = groups[limit - 1]['key'] if len(groups) > limit else None
+    return groups[:limit], next_after
+
+
+def grade_histogram(dimension=None, key=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Count of each grade, optionally restricted to one key of `dimension`"""
+    import numpy as np
+    counts = np.zeros(UNGRADED + 1, dtype=np.int64)
+    for _, _, _, codes in iter_chunks(dimension, key, chunk_size):
+        counts += np.bincount(codes, minlength=UNGRADED + 1)
+    histogram = dict(zip(GRADES, counts[:UNGRADED].tolist()))
+    histogram['ungraded'] = int(counts[UNGRADED])
+    return histogram
+
+
+def sql_gpa_by(dimension, key=None, keys=None):
+    """Same result as gpa_by(), computed with GROUP BY in the database"""
+    key_column = DIMENSIONS[dimension]
+    points = grade_points(Enrollment.grade)
+    credits = func.coalesce(Course.credit_hours, 0)
+    stmt = (
+        select(key_column, func.sum(points * credits), func.sum(credits), func.count())
+        .select_from(Enrollment)
+        .join(Section, Enrollment.section_identifier == Section.section_identifier)
+        .join(Course, Section.course_number == Course.course_number)
+        .where(key_column.isnot(None), points.isnot(None))
+        .group_by(key_column)
+        .order_by(key_column)
+    )
+    if key is not None:
+        stmt = stmt.where(key_column == key)
+    if keys is not None:
+        stmt = stmt.where(key_column.in_(keys))
+    return [
+        {'key': _label(dimension, k), 'gpa': None if not c else round(float(q) / c, 3),
+         'credits': int(c), 'enrollments': int(n)}
+        for k, q, c, n in db.session.execute(stmt)
+    ]
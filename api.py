@@ -0,0 +1,175 @@
+import json
+from flask import Blueprint, Response, abort, request
+from werkzeug.exceptions import HTTPException
+from sqlalchemy import select
+from models import db, Student, Course, Instructor, Section, Enrollment
+from pagination import page_size, parse_after
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Upper bound on keys per batch request, GET or POST
+MAX_BATCH_IDS = 5000
+
+# resource name -> (table, primary key column name, {filter param: column name})
+RESOURCES = {
+    'students': (Student.__table__, 'student_number', {}),
+    'courses': (Course.__table__, 'course_number', {'prerequisite': 'prerequisite'}),
+    'instructors': (Instructor.__table__, 'instructor_name', {}),
+    'sections': (Section.__table__, 'section_identifier',
+                 {'course': 'course_number', 'instructor': 'instructor_name'}),
+    'enrollments': (Enrollment.__table__, 'enrollment_id',
+                    {'student': 'student_number', 'section': 'section_identifier'}),
+}
+
+
+def dumps(payload):
+    """Serialize to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=lambda value: value.isoformat()).encode()
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    return json_response({'error': error.name, 'message': error.description}, error.code)
+
+
+def _resource(name):
+    if name not in RESOURCES:
+        abort(404)
+    return RESOURCES[name]
+
+
+def _columns(table, key, fields):
+    """Columns to load for ?fields=, plus whether the key was only added for bookkeeping
+
+    The key column is always selected so rows can be matched up, but it is
+    stripped from the output again if the caller didn't ask for it.
+    """
+    if not fields:
+        return list(table.c), False
+    unknown = [f for f in fields if f not in table.c]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}')
+    columns = [table.c[f] for f in fields]
+    if key in fields:
+        return columns, False
+    return [table.c[key]] + columns, True
+
+
+def _coerce(column, values):
+    python_type = column.type.python_type
+    coerced = []
+    for value in values:
+        try:
+            coerced.append(python_type(value))
+        except (TypeError, ValueError):
+            abort(400, f'Invalid {column.name} value {value!r}')
+    return coerced
+
+
+def _split(raw):
+    return [part for part in raw.split(',') if part != ''] if raw else []
+
+
+def _param_values(args, name):
+    """Values of a list parameter: ?name=a,b or, for values holding commas, ?name=a&name=b
+
+    A repeated parameter is taken value by value with no splitting, so
+    instructor names like 'Smith, Jane' survive.
+    """
+    values = args.getlist(name)
+    if len(values) > 1:
+        return [value for value in values if value != '']
+    return _split(values[0] if values else None)
+
+
+def _rows(columns, stmt):
+    """Plain dicts straight from the result tuples; no ORM objects are built"""
+    names = [c.name for c in columns]
+    return [dict(zip(names, row)) for row in db.session.execute(stmt)]
+
+
+def batch_lookup(table, key, ids, fields):
+    """Resolve up to MAX_BATCH_IDS keys with a single IN-list query
+
+    Returns (rows, missing); rows come back in the order the ids were given.
+    """
+    if len(ids) > MAX_BATCH_IDS:
+        abort(413, f'At most {MAX_BATCH_IDS} ids per request')
+    key_column = table.c[key]
+    ids = _coerce(key_column, ids)
+    columns, strip_key = _columns(table, key, fields)
+    found = {row[key]: row for row in _rows(columns, select(*columns).where(key_column.in_(ids)))}
+    if strip_key:
+        for row in found.values():
+            row.pop(key)
+    unique_ids = dict.fromkeys(ids)
+    rows = [found[i] for i in unique_ids if i in found]
+    missing = [i for i in unique_ids if i not in found]
+    return rows, missing
+
+
+@api.route('/<string:resource>')
+def resource_collection(resource):
+    """?ids=1,2,3 (or repeated ?ids=) for a batch, otherwise a keyset page; ?fields= limits the columns"""
+    table, key, filters = _resource(resource)
+    fields = _split(request.args.get('fields'))
+    ids = _param_values(request.args, 'ids')
+    if ids:
+        rows, missing = batch_lookup(table, key, ids, fields)
+        return json_response({'data': rows, 'missing': missing})
+
+    key_column = table.c[key]
+    columns, strip_key = _columns(table, key, fields)
+    limit = page_size(request.args)
+    stmt = select(*columns).order_by(key_column).limit(limit + 1)
+    after = parse_after(key_column, request.args.get('after'))
+    if after is not None:
+        stmt = stmt.where(key_column > after)
+    for param, column_name in filters.items():
+        values = _param_values(request.args, param)
+        if values:
+            column = table.c[column_name]
+            stmt = stmt.where(column.in_(_coerce(column, values)))
+    rows = _rows(columns, stmt)
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1][key]
+    if strip_key:
+        for row in rows:
+            row.pop(key)
+    return json_response({'data': rows, 'next_after': next_after})
+
+
+@api.route('/<string:resource>/batch', methods=['POST'])
+def resource_batch(resource):
+    """POST {"ids": [...], "fields": [...]} for batches too long for a query string"""
+    table, key, _ = _resource(resource)
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('ids'), list):
+        abort(400, 'Expected a JSON object with an "ids" list')
+    fields = body.get('fields') or []
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        abort(400, '"fields" must be a list of column names')
+    rows, missing = batch_lookup(table, key, body['ids'], fields)
+    return json_response({'data': rows, 'missing': missing})
+
+
+@api.route('/<string:resource>/<path:id>')
+def resource_item(resource, id):
+    table, key, _ = _resource(resource)
+    rows, _ = batch_lookup(table, key, [id], _split(request.args.get('fields')))
+    if not rows:
+        abort(404)
+    return json_response(rows[0])
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+from a2wsgi import WSGIMiddleware
+from jinja2 import Environment
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import contains_eager
+from werkzeug.exceptions import HTTPException
+from main import app as flask_app
+from models import db, Student, Course, Instructor, Section
+from transcripts import transcript_query
+from dbconfig import async_database_url, async_engine_options, install_sqlite_pragmas
+
+# ASGI entry point: `uvicorn asgi:app`, or under gunicorn with
+# `-k uvicorn.workers.UvicornWorker`. The detail pages run on an AsyncSession,
+# so a worker waiting on the database keeps serving other requests; every
+# other route is handed to the sync Flask app on a thread pool. `main:app`
+# is unchanged and remains the default in the Procfile.
+
+logger = logging.getLogger(__name__)
+
+# Flask-SQLAlchemy resolves relative SQLite paths against the instance folder; use the URL it settled on
+with flask_app.app_context():
+    database_url = db.engine.url
+engine = create_async_engine(async_database_url(database_url), **async_engine_options(database_url))
+install_sqlite_pragmas(engine.sync_engine)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# The Flask templates, with url_for answered from Flask's own URL map so links come out identical
+urls = flask_app.url_map.bind('')
+templates = Environment(loader=flask_app.jinja_loader, autoescape=True)
+templates.globals['url_for'] = lambda endpoint, **values: urls.build(endpoint, values)
+
+
+def render(template, **context):
+    return templates.get_template(template).render(**context).encode()
+
+
+async def _in_session(query):
+    async with async_session() as session:
+        return await query(session)
+
+
+async def concurrently(*queries):
+    """Run each `query(session)` coroutine on its own session and connection, all at once"""
+    return await asyncio.gather(*(_in_session(query) for query in queries))
+
+
+async def _all(session, stmt):
+    return (await session.execute(stmt)).all()
+
+
+async def _scalars(session, stmt):
+    return (await session.execute(stmt)).scalars().all()
+
+
+async def student_detail(id):
+    student, enrollments = await concurrently(
+        lambda session: session.get(Student, id),
+        lambda session: _all(session, transcript_query(id)),
+    )
+    return render('student_detail.html', student=student, enrollments=enrollments)
+
+
+async def instructor_detail(id):
+    instructor, sections = await concurrently(
+        lambda session: session.get(Instructor, id),
+        lambda session: _scalars(session, select(Section).join(Course).options(contains_eager(Section.course))
+                                 .where(Section.instructor_name == id)),
+    )
+    return render('instructor_detail.html', instructor=instructor, sections=sections)
+
+
+async def course_detail(course_id):
+    course, prerequisites = await concurrently(
+        lambda session: session.get(Course, course_id),
+        lambda session: _scalars(session, select(Course).where(Course.prerequisite == course_id)),
+    )
+    return render('course_detail.html', course=course, prerequisites=prerequisites)
+
+
+async def section_detail(section_id):
+    section = await _in_session(lambda session: session.get(Section, section_id))
+    return render('section_detail.html', section=section)
+
+
+# Flask endpoint -> async view taking the same URL arguments
+ASYNC_VIEWS = {
+    'student_detail': student_detail,
+    'instructor_detail': instructor_detail,
+    'course_detail': course_detail,
+    'section_detail': section_detail,
+}
+
+
+class AsyncApp:
+    """Routes with Flask's URL map: endpoints in ASYNC_VIEWS run here, the rest go to Flask"""
+
+    def __init__(self, wsgi_app, views):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 10)))
+        self.views = views
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        view, args = self.match(scope)
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+        try:
+            status, body = 200, await view(**args)
+        except Exception:
+            logger.exception('Error in async view for %s', scope['path'])
+            status, body = 500, b'Internal Server Error'
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'text/html; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return None, None
+        try:
+            endpoint, args = urls.match(scope['path'], 'GET')
+        except HTTPException:
+            # 404s, 405s and slash redirects are Flask's to answer
+            return None, None
+        return self.views.get(endpoint), args
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(flask_app, ASYNC_VIEWS)
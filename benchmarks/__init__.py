@@ -0,0 +1 @@
+"""Standalone benchmark scripts; run them from the repository root with ``python -m benchmarks.<name>``."""
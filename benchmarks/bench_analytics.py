@@ -0,0 +1,86 @@
+"""GPA analytics: chunked NumPy engine vs SQL GROUP BY vs a naive ORM loop.
+
+Ends with the route as served: a first page of /analytics/gpa/<dimension>
+on a cold cache and again once cached, next to the SQL GROUP BY that
+computes the same groups.
+
+    python -m benchmarks.bench_analytics --enrollments 10000000
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+
+def naive_gpa_by_student(db, Enrollment, Section):
+    """What a per-row Python implementation looks like: hydrate every enrollment"""
+    from analytics import GRADE_POINTS
+    points = dict(GRADE_POINTS)
+    totals = {}
+    stmt = (db.select(Enrollment)
+            .options(db.joinedload(Enrollment.section).joinedload(Section.course))
+            .execution_options(yield_per=10000))
+    for enrollment in db.session.execute(stmt).scalars():
+        grade = points.get((enrollment.grade or '').strip().upper())
+        if grade is None:
+            continue
+        credits = enrollment.section.course.credit_hours or 0
+        quality, hours = totals.get(enrollment.student_number, (0.0, 0))
+        totals[enrollment.student_number] = (quality + grade * credits, hours + credits)
+    return totals
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f'{label:<40} {time.perf_counter() - started:8.2f}s  {len(result):>10,} groups  '
+          f'peak RSS {peak_rss_mb():,.0f} MB')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--enrollments', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=200000)
+    parser.add_argument('--naive-max', type=int, default=1000000,
+                        help='skip the ORM loop above this many enrollments')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-analytics-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from main import app, db, Enrollment, Section
+    from analytics import gpa_by, grade_histogram, sql_gpa_by
+    from datagen import DatasetSpec, load_dataset
+
+    spec = DatasetSpec(students=max(args.enrollments // 10, 10), courses=2000, instructors=500,
+                       terms=12, sections_per_term=max(args.enrollments // 1000, 10), enrollments_per_student=10)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        load_dataset(db.engine, spec)
+        print(f'Loaded {spec.students * 10:,} enrollments in {time.perf_counter() - started:.1f}s\n')
+
+        for dimension in ['student', 'section', 'instructor', 'term']:
+            timed(f'numpy  gpa_by({dimension})', lambda: gpa_by(dimension, chunk_size=args.chunk_size))
+            timed(f'sql    gpa_by({dimension})', lambda: sql_gpa_by(dimension))
+        timed('numpy  grade_histogram()', lambda: grade_histogram(chunk_size=args.chunk_size))
+        if spec.students * 10 <= args.naive_max:
+            timed('naive  ORM loop by student', lambda: naive_gpa_by_student(db, Enrollment, Section))
+
+    print()
+    client = app.test_client()
+    for dimension in ['student', 'section', 'instructor', 'term']:
+        url = f'/analytics/gpa/{dimension}'
+        timed(f'route  {url} cold', lambda: client.get(url).get_json()['groups'])
+        timed(f'route  {url} cached', lambda: client.get(url).get_json()['groups'])
+        with app.app_context():
+            timed(f'sql    gpa_by({dimension})', lambda: sql_gpa_by(dimension))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Fetching many students: one HTML page per id vs the batched JSON API.
+
+    python -m benchmarks.bench_api --students 100000 --batch 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def report(label, count, seconds):
+    print(f'{label:<34} {seconds:8.3f}s  {count / seconds:>10,.0f} students/sec  '
+          f'{seconds / count * 1e6:8.1f} us/student')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=2000, help='ids per batch request')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-api-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    # Measure the database path, not cache hits
+    os.environ['RESPONSE_CACHE_BACKEND'] = 'none'
+    from main import app, db
+    from datagen import DatasetSpec, load_dataset
+
+    spec = DatasetSpec(students=args.students, enrollments_per_student=4)
+    with app.app_context():
+        db.create_all()
+        load_dataset(db.engine, spec)
+    client = app.test_client()
+    rng = random.Random(7)
+
+    for round_number in range(args.rounds):
+        ids = rng.sample(range(1, args.students + 1), args.batch)
+        print(f'-- round {round_number + 1}: {len(ids)} students')
+
+        started = time.perf_counter()
+        for student in ids:
+            client.get(f'/students/{student}')
+        report('HTML /students/<id> per id', len(ids), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for student in ids:
+            client.get(f'/api/v1/students/{student}')
+        report('JSON /api/v1/students/<id> per id', len(ids), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        response = client.get('/api/v1/students?ids=' + ','.join(map(str, ids)))
+        assert len(response.json['data']) == len(ids)
+        report('JSON GET ?ids= batch', len(ids), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        response = client.post('/api/v1/students/batch', json={'ids': ids, 'fields': ['name']})
+        assert len(response.json['data']) == len(ids)
+        report('JSON POST batch, fields=name', len(ids), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        response = client.get('/api/v1/enrollments?limit=1000&student=' + ','.join(map(str, ids[:250])))
+        report('JSON enrollments for 250 students', 250, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
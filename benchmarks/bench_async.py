@@ -0,0 +1,164 @@
+"""Load test: sync `main:app` vs the async `asgi:app` on the detail pages.
+
+Generates a dataset in a local SQLite file, starts each mode under gunicorn
+with the same number of workers, and drives it with --concurrency clients
+that each request random student, instructor, course and section pages
+back to back over keep-alive connections. Reports requests/sec and latency
+percentiles per mode and concurrency level.
+
+    python -m benchmarks.bench_async --concurrency 50 100 250 500 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+MODES = {
+    'sync': ['main:app'],
+    'async': ['asgi:app', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def detail_urls(spec, count, seed=3):
+    from datagen import course_numbers
+    rng = random.Random(seed)
+    courses = course_numbers(spec)
+    makers = [
+        lambda: f'/students/{rng.randint(1, spec.students)}',
+        lambda: f'/instructors/{quote(spec.instructor_name(rng.randrange(spec.instructors)))}',
+        lambda: f'/courses/{rng.choice(courses)}',
+        lambda: f'/sections/{rng.randint(1, spec.terms * spec.sections_per_term)}',
+    ]
+    return [rng.choice(makers)() for _ in range(count)]
+
+
+async def fetch(conn, host, port, path):
+    """One GET over `conn` (opened if None); returns (status, conn to reuse or None)"""
+    if conn is None:
+        conn = await asyncio.open_connection(host, port)
+    reader, writer = conn
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    if headers.get('connection', '').lower() == 'close':
+        writer.close()
+        conn = None
+    return int(status_line.split()[1]), conn
+
+
+async def client(host, port, urls, deadline, latencies, errors):
+    conn = None
+    i = random.randrange(len(urls))
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status, conn = await fetch(conn, host, port, urls[i % len(urls)])
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors.append(1)
+            conn = None
+            await asyncio.sleep(0.01)
+            continue
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+        i += 1
+    if conn is not None:
+        conn[1].close()
+
+
+async def load(port, urls, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client('127.0.0.1', port, urls, deadline, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, q):
+    return values[min(int(len(values) * q), len(values) - 1)] * 1000 if values else float('nan')
+
+
+def wait_until_up(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f'server exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit('server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 100, 250, 500])
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-async-')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'),
+               PYTHONPATH=os.getcwd(),
+               # Measure the database round trips rather than cache hits or bookkeeping
+               RESPONSE_CACHE_BACKEND='none', METRICS_SAMPLE_RATE='0')
+    os.environ.update(env)
+    from main import app, db
+    from datagen import DatasetSpec, load_dataset
+    from migrations import upgrade
+
+    spec = DatasetSpec(students=args.students, enrollments_per_student=8)
+    with app.app_context():
+        upgrade(db.engine)
+        load_dataset(db.engine, spec)
+    urls = detail_urls(spec, 10000)
+
+    print(f'{"mode":<6} {"clients":>7} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9} {"errors":>7}')
+    for mode in args.modes:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *MODES[mode], '-w', str(args.workers),
+             '-b', f'127.0.0.1:{port}', '--backlog', '2048', '--log-level', 'warning'],
+            env=env)
+        try:
+            wait_until_up(port, server)
+            asyncio.run(load(port, urls, 10, 2))  # warm up pools and template caches
+            for concurrency in args.concurrency:
+                latencies, errors, elapsed = asyncio.run(load(port, urls, concurrency, args.duration))
+                latencies.sort()
+                print(f'{mode:<6} {concurrency:>7} {len(latencies) / elapsed:>9.0f} {percentile(latencies, 0.5):>9.1f} '
+                      f'{percentile(latencies, 0.95):>9.1f} {percentile(latencies, 0.99):>9.1f} '
+                      f'{percentile(latencies, 1.0):>9.1f} {len(errors):>7}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Per-route query plans and latency before and after the secondary-index migration.
+
+Loads a throwaway SQLite database with --enrollments rows using datagen,
+drops the model indexes to reproduce an un-migrated database, measures each detail route,
+then runs the migrations and measures again.
+
+    python -m benchmarks.bench_indexes --enrollments 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def explain(db, sql, params):
+    with db.engine.connect() as conn:
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        rows = conn.exec_driver_sql(prefix + sql, params).all()
+    return [str(row[-1]) for row in rows]
+
+
+def measure(client, urls):
+    timings = []
+    for url in urls:
+        started = time.perf_counter()
+        client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def run_phase(label, app, db, route_urls, plan_queries):
+    print(f'\n== {label} ==')
+    client = app.test_client()
+    for name, urls in route_urls.items():
+        mean, p95 = measure(client, urls)
+        print(f'{name:<20} mean {mean:8.2f} ms   p95 {p95:8.2f} ms')
+    with app.app_context():
+        for name, (sql, params) in plan_queries.items():
+            print(f'  plan {name}: ' + ' | '.join(explain(db, sql, params)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--enrollments', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=50, help='requests per route per phase')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-indexes-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    # Repeated requests would otherwise time cache hits, not the indexes
+    os.environ['RESPONSE_CACHE_BACKEND'] = 'none'
+    from main import app, db
+    from migrations import MIGRATIONS, upgrade
+    from datagen import DatasetSpec, course_numbers, load_dataset
+
+    # Eight enrollments per student, spread over eight terms of sections
+    spec = DatasetSpec(students=max(args.enrollments // 8, 10), courses=max(args.enrollments // 2000, 40),
+                       instructors=max(args.enrollments // 5000, 10), terms=8,
+                       sections_per_term=max(args.enrollments // 800, 10), enrollments_per_student=8)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        load_dataset(db.engine, spec, drop_indexes=False)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(db.engine)
+        print(f'Loaded {spec.students * 8} enrollments in {time.perf_counter() - started:.1f}s')
+
+    rng = random.Random(7)
+    route_urls = {
+        'student_detail': [f'/students/{rng.randint(1, spec.students)}' for _ in range(args.requests)],
+        'instructor_detail': [f'/instructors/{spec.instructor_name(rng.randrange(spec.instructors))}'
+                              for _ in range(args.requests)],
+        'course_detail': [f'/courses/{rng.choice(course_numbers(spec))}' for _ in range(args.requests)],
+        'section_detail': [f'/sections/{rng.randint(1, spec.terms * spec.sections_per_term)}'
+                           for _ in range(args.requests)],
+    }
+    plan_queries = {
+        'enrollments.student_number': ('SELECT * FROM enrollments WHERE student_number = ?', (1,)),
+        'enrollments.section_identifier': ('SELECT * FROM enrollments WHERE section_identifier = ?', (1,)),
+        'sections.instructor_name': ('SELECT * FROM sections WHERE instructor_name = ?', (spec.instructor_name(0),)),
+        'sections.year_semester': ('SELECT * FROM sections WHERE year = ? AND semester = ?', (2019, 'Fall')),
+        'courses.prerequisite': ('SELECT * FROM courses WHERE prerequisite = ?', (1,)),
+    }
+
+    run_phase('before migrations', app, db, route_urls, plan_queries)
+    with app.app_context():
+        started = time.perf_counter()
+        applied = upgrade(db.engine)
+        print(f'\nApplied {len(applied)} of {len(MIGRATIONS)} migrations in {time.perf_counter() - started:.1f}s')
+    run_phase('after migrations', app, db, route_urls, plan_queries)
+
+
+if __name__ == '__main__':
+    main()
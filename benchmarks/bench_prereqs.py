@@ -0,0 +1,94 @@
+"""Prerequisite lookups: naive per-hop ORM walk vs recursive CTE vs in-memory graph.
+
+Loads a catalog of --courses courses whose prerequisites form long chains,
+then answers "what must I take before X" and "what does X unlock" for a
+random sample of courses with each strategy.
+
+    python -m benchmarks.bench_prereqs --courses 10000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def catalog(courses, seed=42):
+    rng = random.Random(seed)
+    for number in range(1, courses + 1):
+        # Mostly a recent course as prerequisite, which builds long chains
+        prerequisite = rng.randint(max(1, number - 20), number - 1) if number > 1 and rng.random() < 0.9 else None
+        yield {'course_number': number, 'course_name': f'Course {number}', 'credit_hours': 3,
+               'prerequisite': prerequisite}
+
+
+def naive_ancestors(db, Course, course_number):
+    chain = []
+    course = db.session.get(Course, course_number)
+    while course is not None and course.prerequisite is not None:
+        chain.append(course.prerequisite)
+        course = db.session.get(Course, course.prerequisite)
+    return chain
+
+
+def naive_descendants(Course, course_number):
+    result = []
+    frontier = [course_number]
+    while frontier:
+        following = []
+        for current in frontier:
+            for course in Course.query.filter_by(prerequisite=current).all():
+                result.append(course.course_number)
+                following.append(course.course_number)
+        frontier = following
+    return result
+
+
+def timed(label, db, fn, sample):
+    started = time.perf_counter()
+    sizes = 0
+    for course in sample:
+        sizes += len(fn(course))
+        # Start every lookup with an empty identity map, like a fresh request
+        db.session.remove()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<28} {elapsed / len(sample) * 1000:10.3f} ms/lookup  ({sizes / len(sample):.1f} courses avg)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courses', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-prereqs-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from main import app, db, Course
+    from datagen import bulk_load
+    from prereqs import ancestors_cte, descendants_cte, load_graph
+
+    rng = random.Random(7)
+    sample = [rng.randint(1, args.courses) for _ in range(args.lookups)]
+    with app.app_context():
+        db.create_all()
+        bulk_load(db.engine, Course.__table__, catalog(args.courses))
+        started = time.perf_counter()
+        graph = load_graph()
+        print(f'Built graph of {len(graph)} courses in {(time.perf_counter() - started) * 1000:.1f} ms, '
+              f'max depth {max(graph.depth.values())}, {len(graph.cycles)} cycles\n')
+
+        timed('ancestors: ORM per hop', db, lambda c: naive_ancestors(db, Course, c), sample)
+        timed('ancestors: recursive CTE', db, ancestors_cte, sample)
+        timed('ancestors: graph', db, graph.ancestors, sample)
+        descendant_sample = sample[:max(len(sample) // 10, 1)]
+        timed('descendants: ORM per hop', db, lambda c: naive_descendants(Course, c), descendant_sample)
+        timed('descendants: recursive CTE', db, descendants_cte, descendant_sample)
+        timed('descendants: graph', db, graph.descendants, descendant_sample)
+
+        started = time.perf_counter()
+        checks = [graph.requires(rng.randint(1, args.courses), rng.randint(1, args.courses)) for _ in range(100000)]
+        print(f'\nrequires(): {(time.perf_counter() - started) / len(checks) * 1e6:.2f} us/check')
+
+
+if __name__ == '__main__':
+    main()
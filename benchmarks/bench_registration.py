@@ -0,0 +1,195 @@
+"""Registration stress test: parallel batches against a few workers, then an oversell audit.
+
+Generates a dataset in a local SQLite file, opens a new term of sections
+with small capacities (plus a handful of five-seat "hot" sections that every
+client hammers), starts gunicorn with --workers processes and has --clients
+threads POST random batches to /api/v1/registrations at once. Reports
+throughput, then checks the database directly:
+  - no section holds more students than its capacity
+  - every hot section is exactly full
+  - no student takes the same course twice in the term
+  - every new enrollment's prerequisite was passed in an earlier term
+  - the database holds exactly the enrollments the responses reported
+Exits 1 if any check fails.
+
+    python -m benchmarks.bench_registration --workers 4 --clients 32 --batches 20
+"""
+import argparse
+import collections
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.bench_async import free_port, percentile, wait_until_up
+
+
+def open_term(engine, sections, hot, capacity, seed):
+    """Add a term after the generated ones; returns (semester, year, section ids, hot section ids)"""
+    from sqlalchemy import func, insert, select
+    from models import Course, Section
+    rng = random.Random(seed)
+    with engine.begin() as conn:
+        year = conn.execute(select(func.max(Section.year))).scalar() + 1
+        courses = conn.execute(select(Course.course_number)).scalars().all()
+        # Hot sections are open to everyone so that demand alone fills them
+        open_courses = conn.execute(select(Course.course_number).where(Course.prerequisite.is_(None))).scalars().all()
+        rows = [{'course_number': open_courses[i % len(open_courses)], 'semester': 'Spring', 'year': year,
+                 'capacity': 5} for i in range(hot)]
+        rows += [{'course_number': rng.choice(courses), 'semester': 'Spring', 'year': year,
+                  'capacity': rng.randint(capacity // 2, capacity)} for _ in range(sections - hot)]
+        conn.execute(insert(Section), rows)
+        ids = conn.execute(select(Section.section_identifier).where(Section.year == year)
+                           .order_by(Section.section_identifier)).scalars().all()
+    return 'Spring', year, ids, ids[:hot]
+
+
+def client(port, batches, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    for batch in batches:
+        started = time.perf_counter()
+        conn.request('POST', '/api/v1/registrations', json.dumps({'enrollments': batch}),
+                     {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        body = json.loads(response.read())
+        results.append((response.status, body, time.perf_counter() - started))
+    conn.close()
+
+
+def audit(engine, semester, year, hot, enrolled):
+    """Failed checks as messages; empty if the term is consistent"""
+    from sqlalchemy import text
+    from analytics import GRADE_POINTS
+    failures = []
+    term = {'semester': semester, 'year': year}
+    with engine.connect() as conn:
+        oversold = conn.execute(text(
+            'SELECT s.section_identifier, s.capacity, COUNT(*) FROM sections s '
+            'JOIN enrollments e ON e.section_identifier = s.section_identifier '
+            'WHERE s.semester = :semester AND s.year = :year '
+            'GROUP BY s.section_identifier, s.capacity HAVING COUNT(*) > s.capacity'), term).all()
+        if oversold:
+            failures.append(f'{len(oversold)} oversold sections, e.g. {oversold[:5]}')
+        counts = dict(conn.execute(text(
+            'SELECT section_identifier, COUNT(*) FROM enrollments GROUP BY section_identifier')).all())
+        capacities = dict(conn.execute(text(
+            'SELECT section_identifier, capacity FROM sections WHERE semester = :semester AND year = :year'), term).all())
+        not_full = [(section, counts.get(section, 0), capacities[section]) for section in hot
+                    if counts.get(section, 0) != capacities[section]]
+        if not_full:
+            failures.append(f'hot sections not exactly full: {not_full}')
+        doubled = conn.execute(text(
+            'SELECT e.student_number, s.course_number FROM enrollments e '
+            'JOIN sections s ON s.section_identifier = e.section_identifier '
+            'WHERE s.semester = :semester AND s.year = :year '
+            'GROUP BY e.student_number, s.course_number HAVING COUNT(*) > 1'), term).all()
+        if doubled:
+            failures.append(f'{len(doubled)} students take a course twice, e.g. {doubled[:5]}')
+
+        # Prerequisites, checked by walking Course.prerequisite rather than
+        # through the PrerequisiteGraph the engine uses
+        parent = dict(conn.execute(text('SELECT course_number, prerequisite FROM courses')).all())
+        passing = {grade for grade, points in GRADE_POINTS if points > 0}
+        completed = collections.defaultdict(set)
+        for student, course, grade in conn.execute(text(
+                'SELECT e.student_number, s.course_number, e.grade FROM enrollments e '
+                'JOIN sections s ON s.section_identifier = e.section_identifier '
+                'WHERE s.year < :year AND e.grade IS NOT NULL'), term):
+            if grade.strip().upper() in passing:
+                while course is not None:
+                    completed[student].add(course)
+                    course = parent.get(course)
+        new = conn.execute(text(
+            'SELECT e.student_number, s.course_number FROM enrollments e '
+            'JOIN sections s ON s.section_identifier = e.section_identifier '
+            'WHERE s.semester = :semester AND s.year = :year'), term).all()
+        missing = [(student, course) for student, course in new
+                   if parent.get(course) is not None and parent[course] not in completed[student]]
+        if missing:
+            failures.append(f'{len(missing)} enrollments lack a prerequisite, e.g. {missing[:5]}')
+        if len(new) != enrolled:
+            failures.append(f'responses reported {enrolled} enrollments but the term holds {len(new)}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent client threads')
+    parser.add_argument('--batches', type=int, default=20, help='Batches per client')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--sections', type=int, default=400, help='Sections in the new term')
+    parser.add_argument('--capacity', type=int, default=40, help='Largest regular section capacity')
+    parser.add_argument('--hot', type=int, default=10, help='Five-seat sections every client targets')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-registration-')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'),
+               PYTHONPATH=os.getcwd(), METRICS_SAMPLE_RATE='0')
+    os.environ.update(env)
+    from main import app, db
+    from datagen import DatasetSpec, load_dataset
+    from migrations import upgrade
+
+    with app.app_context():
+        upgrade(db.engine)
+        load_dataset(db.engine, DatasetSpec(students=args.students))
+        semester, year, sections, hot = open_term(db.engine, args.sections, args.hot, args.capacity, args.seed)
+        db.engine.dispose()
+
+    rng = random.Random(args.seed)
+    work = [[[{'student_number': rng.randint(1, args.students),
+               # A fifth of all requests go to the hot sections
+               'section_identifier': rng.choice(hot if rng.random() < 0.2 else sections)}
+              for _ in range(args.batch_size)] for _ in range(args.batches)] for _ in range(args.clients)]
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'main:app', '-w', str(args.workers), '-b', f'127.0.0.1:{port}',
+         '--backlog', '2048', '--timeout', '120', '--log-level', 'warning'], env=env)
+    results = []
+    try:
+        wait_until_up(port, server)
+        threads = [threading.Thread(target=client, args=(port, batches, results)) for batches in work]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    statuses = collections.Counter(status for status, _, _ in results)
+    ok = [body for status, body, _ in results if status == 200]
+    enrolled = sum(body['enrolled'] for body in ok)
+    reasons = collections.Counter(item['reason'] for body in ok for item in body['rejected'])
+    latencies = sorted(seconds for _, _, seconds in results)
+    requests = sum(len(batch) for batches in work for batch in batches)
+    print(f'{len(results)} batches, {requests} requests in {elapsed:.1f}s with {args.workers} workers, '
+          f'{args.clients} clients')
+    print(f'  {len(results) / elapsed:,.1f} batches/s   {requests / elapsed:,.0f} requests/s   '
+          f'{enrolled / elapsed:,.0f} enrollments/s')
+    print(f'  batch latency p50 {percentile(latencies, 0.5):.0f} ms   p95 {percentile(latencies, 0.95):.0f} ms   '
+          f'max {percentile(latencies, 1.0):.0f} ms')
+    print(f'  statuses {dict(statuses)}')
+    print(f'  enrolled {enrolled}; rejected {dict(reasons.most_common())}')
+
+    with app.app_context():
+        failures = audit(db.engine, semester, year, hot, enrolled)
+    for failure in failures:
+        print('FAIL', failure)
+    if failures or statuses.keys() - {200, 409}:
+        sys.exit(1)
+    print('OK: no section oversold, no duplicate courses, prerequisites hold')
+
+
+if __name__ == '__main__':
+    main()
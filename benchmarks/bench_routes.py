@@ -0,0 +1,327 @@
+"""Route benchmark suite: per-view micro-benchmarks and an HTTP load test, compared to a baseline.
+
+For each --scales entry (1k, 100k or 1m enrollments) a reproducible dataset
+is generated into --data-dir (reused on later runs), then:
+  - micro: every GET route is requested through the Flask test client until
+    it has run --min-rounds times and for --min-time seconds. The
+    Server-Timing header splits each request into db (statement
+    execution), render (templates) and app (everything else, including
+    fetching rows from a cursor and hydrating them) time.
+  - load: gunicorn is started with gunicorn.conf.py and --workers workers,
+    and --concurrency keep-alive clients request a weighted mix of detail,
+    listing, search and API pages for --duration seconds.
+The response cache is off, so every request does its full work. Results
+are written to --out as JSON. Given --baseline, every median latency,
+query count and throughput is compared with it, and the exit status is 1
+if any got worse by more than --threshold.
+
+    python -m benchmarks.bench_routes --scales 1k 100k 1m --out baseline.json
+    python -m benchmarks.bench_routes --scales 1k 100k --baseline baseline.json
+    python -m benchmarks.bench_routes --compare results.json --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from urllib.parse import quote
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+# Route arguments that sample_route_args() does not cover
+EXTRA_ROUTE_ARGS = {'analytics_gpa': {'dimension': 'course'}}
+PHASES = ('db', 'render', 'app')
+SERVER_TIMING = re.compile(r'(\w+);dur=([\d.]+)')
+STATEMENTS = re.compile(r'"(\d+) queries"')
+# Ignore changes smaller than this, whatever the ratio: sub-millisecond routes are mostly noise
+MIN_DELTA_MS = 0.25
+
+
+def dataset_spec(enrollments):
+    """Eight enrollments per student spread over eight terms, as in bench_indexes"""
+    from datagen import DatasetSpec
+    return DatasetSpec(students=max(enrollments // 8, 10), courses=max(enrollments // 2000, 40),
+                       instructors=max(enrollments // 5000, 10), terms=8,
+                       sections_per_term=max(enrollments // 800, 10), enrollments_per_student=8)
+
+
+def seed(app, db, spec):
+    """Load `spec` into an empty database, then build indexes and search tables"""
+    from datagen import load_dataset
+    from migrations import upgrade
+    with app.app_context():
+        db.create_all()
+        load_dataset(db.engine, spec)
+        # After the load, so the search index is built in one pass rather than by triggers
+        upgrade(db.engine)
+        db.engine.dispose()
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'min': round(values[0], 3),
+        'median': round(statistics.median(values), 3),
+        'mean': round(statistics.fmean(values), 3),
+        'p95': round(values[min(int(len(values) * 0.95), len(values) - 1)], 3),
+        'stddev': round(statistics.pstdev(values), 3),
+    }
+
+
+def route_urls(app):
+    """(endpoint, url) for every GET route the budget checker would request"""
+    from flask import url_for
+    from querycount import SKIP_ENDPOINTS, sample_route_args
+    with app.app_context():
+        samples = {**sample_route_args(), **EXTRA_ROUTE_ARGS}
+    urls = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.endpoint):
+        if rule.endpoint in SKIP_ENDPOINTS or 'GET' not in rule.methods:
+            continue
+        args = samples.get(rule.endpoint, {})
+        if set(rule.arguments) - set(args) or any(v is None for v in args.values()):
+            continue
+        with app.test_request_context():
+            urls.append((rule.endpoint, url_for(rule.endpoint, **args)))
+    return urls
+
+
+def micro(app, urls, min_rounds, min_time, max_rounds):
+    client = app.test_client()
+    results = {}
+    for endpoint, url in urls:
+        client.get(url)  # warm up connections, templates and lazily built indexes
+        totals, phases, statements = [], {phase: [] for phase in PHASES}, 0
+        started = time.perf_counter()
+        while len(totals) < max_rounds and (len(totals) < min_rounds or time.perf_counter() - started < min_time):
+            request_started = time.perf_counter()
+            response = client.get(url)
+            totals.append((time.perf_counter() - request_started) * 1000)
+            header = response.headers.get('Server-Timing', '')
+            timing = dict(SERVER_TIMING.findall(header))
+            for phase in PHASES:
+                phases[phase].append(float(timing.get(phase, 0)))
+            match = STATEMENTS.search(header)
+            statements = int(match.group(1)) if match else 0
+        results[endpoint] = {
+            'url': url, 'status': response.status_code, 'rounds': len(totals), 'queries': statements,
+            'total_ms': summarize(totals), **{f'{phase}_ms': summarize(phases[phase]) for phase in PHASES},
+        }
+    return results
+
+
+def load_mix(spec, count, seed=5):
+    """(label, url) pairs drawn with Locust-style task weights"""
+    from datagen import FIRST_NAMES, course_numbers
+    rng = random.Random(seed)
+    courses = course_numbers(spec)
+    sections = spec.terms * spec.sections_per_term
+    tasks = [
+        (30, 'student_detail', lambda: f'/students/{rng.randint(1, spec.students)}'),
+        (15, 'course_detail', lambda: f'/courses/{rng.choice(courses)}'),
+        (10, 'instructor_detail', lambda: f'/instructors/{quote(spec.instructor_name(rng.randrange(spec.instructors)))}'),
+        (15, 'section_detail', lambda: f'/sections/{rng.randint(1, sections)}'),
+        (5, 'students_all', lambda: '/students/all'),
+        (5, 'courses_all', lambda: '/courses/all'),
+        (5, 'instructors_all', lambda: '/instructors/all'),
+        (5, 'sections_all', lambda: '/sections/all'),
+        (5, 'search_suggest', lambda: f'/search/suggest?q={rng.choice(FIRST_NAMES)[:3]}'),
+        (5, 'api.resource_item', lambda: f'/api/v1/students/{rng.randint(1, spec.students)}'),
+    ]
+    weights = [weight for weight, _, _ in tasks]
+    return [(label, make()) for _, label, make in rng.choices(tasks, weights, k=count)]
+
+
+async def _client(port, mix, deadline, latencies, errors):
+    from benchmarks.bench_async import fetch
+    conn = None
+    i = random.randrange(len(mix))
+    while time.perf_counter() < deadline:
+        label, url = mix[i % len(mix)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            status, conn = await fetch(conn, '127.0.0.1', port, url)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors.append(label)
+            conn = None
+            continue
+        if status == 200:
+            latencies.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+        else:
+            errors.append(label)
+    if conn is not None:
+        conn[1].close()
+
+
+async def _drive(port, mix, concurrency, duration):
+    latencies, errors = {}, []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(_client(port, mix, deadline, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def load_test(env, spec, workers, concurrency, duration):
+    from benchmarks.bench_async import free_port, wait_until_up
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'main:app', '-w', str(workers),
+                               '-b', f'127.0.0.1:{port}', '--backlog', '2048', '--log-level', 'warning'], env=env)
+    mix = load_mix(spec, 10000)
+    try:
+        wait_until_up(port, server)
+        asyncio.run(_drive(port, mix, workers, 2))
+        latencies, errors, elapsed = asyncio.run(_drive(port, mix, concurrency, duration))
+    finally:
+        server.terminate()
+        server.wait()
+    everything = [ms for values in latencies.values() for ms in values]
+    return {
+        'workers': workers, 'concurrency': concurrency, 'duration_s': round(elapsed, 2),
+        'requests': len(everything), 'errors': len(errors),
+        'requests_per_sec': round(len(everything) / elapsed, 1),
+        'latency_ms': summarize(everything) if everything else None,
+        'routes': {label: {'requests': len(values), 'latency_ms': summarize(values)}
+                   for label, values in sorted(latencies.items())},
+    }
+
+
+def run_scale(name, options):
+    """One scale, in a fresh process so DATABASE_URL can point at its own file"""
+    spec = dataset_spec(SCALES[name])
+    path = os.path.join(options['data_dir'], f'routes-{name}.db')
+    fresh = not os.path.exists(path)
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, PYTHONPATH=os.getcwd(),
+               RESPONSE_CACHE_BACKEND='none', METRICS_SAMPLE_RATE='1')
+    os.environ.update(env)
+    from main import app, db
+    if fresh:
+        started = time.perf_counter()
+        seed(app, db, spec)
+        print(f'[{name}] seeded {path} in {time.perf_counter() - started:.1f}s', flush=True)
+    result = {'enrollments': SCALES[name]}
+    if not options['skip_micro']:
+        result['micro'] = micro(app, route_urls(app), options['min_rounds'], options['min_time'],
+                                options['max_rounds'])
+    if not options['skip_load']:
+        result['load'] = load_test(env, spec, options['workers'], options['concurrency'], options['duration'])
+    return result
+
+
+def metrics(results):
+    """Flatten results into {name: (value, higher_is_worse)} for comparison"""
+    flat = {}
+    for scale, result in results['scales'].items():
+        for endpoint, micro_result in result.get('micro', {}).items():
+            flat[f'{scale} {endpoint} median ms'] = (micro_result['total_ms']['median'], True)
+            flat[f'{scale} {endpoint} queries'] = (micro_result['queries'], True)
+        load = result.get('load')
+        if load:
+            flat[f'{scale} load req/s'] = (load['requests_per_sec'], False)
+            if load['latency_ms']:
+                flat[f'{scale} load p95 ms'] = (load['latency_ms']['p95'], True)
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """(name, baseline, current, change) for each metric that got worse by more than `threshold`"""
+    current, previous = metrics(results), metrics(baseline)
+    regressions = []
+    for name, (value, higher_is_worse) in current.items():
+        if name not in previous:
+            continue
+        base = previous[name][0]
+        worse = value - base if higher_is_worse else base - value
+        if name.endswith('queries'):
+            regressed = worse > 0
+        else:
+            regressed = worse > threshold * base and (name.endswith('req/s') or worse > MIN_DELTA_MS)
+        if regressed:
+            regressions.append((name, base, value, (value - base) / base if base else float('inf')))
+    return regressions
+
+
+def print_results(results):
+    for scale, result in results['scales'].items():
+        print(f'\n{scale} enrollments')
+        if 'micro' in result:
+            print(f'  {"route":<26} {"rounds":>6} {"median":>9} {"p95":>9} {"db":>8} {"render":>8} {"app":>8} {"queries":>7}')
+            for endpoint, r in result['micro'].items():
+                print(f'  {endpoint:<26} {r["rounds"]:>6} {r["total_ms"]["median"]:>9.2f} {r["total_ms"]["p95"]:>9.2f} '
+                      f'{r["db_ms"]["median"]:>8.2f} {r["render_ms"]["median"]:>8.2f} {r["app_ms"]["median"]:>8.2f} '
+                      f'{r["queries"]:>7}')
+        load = result.get('load')
+        if load:
+            latency = load['latency_ms'] or {}
+            print(f'  load: {load["requests_per_sec"]:,.0f} req/s with {load["concurrency"]} clients and '
+                  f'{load["workers"]} workers, p50 {latency.get("median", 0):.1f} ms, p95 {latency.get("p95", 0):.1f} ms, '
+                  f'{load["errors"]} errors')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['1k', '100k'])
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'bench-routes'),
+                        help='Where seeded databases are kept between runs')
+    parser.add_argument('--min-rounds', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds per route')
+    parser.add_argument('--max-rounds', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load per scale')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--out', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown, as a fraction')
+    parser.add_argument('--compare', metavar='RESULTS', help='Compare this results file instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare) as source:
+            results = json.load(source)
+    else:
+        os.makedirs(args.data_dir, exist_ok=True)
+        results = {'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                   'revision': git_revision(), 'python': platform.python_version(),
+                   'machine': platform.machine(), 'threshold': args.threshold, 'scales': {}}
+        for name in args.scales:
+            # Spawned rather than forked, so each scale imports the app against its own database
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                results['scales'][name] = pool.submit(run_scale, name, vars(args)).result()
+        if args.out:
+            with open(args.out, 'w') as out:
+                json.dump(results, out, indent=2)
+    print_results(results)
+
+    if args.baseline:
+        with open(args.baseline) as source:
+            baseline = json.load(source)
+        regressions = compare(results, baseline, args.threshold)
+        print(f'\nCompared with {args.baseline} (revision {baseline.get("revision")}), threshold {args.threshold:.0%}:')
+        for name, base, value, change in regressions:
+            print(f'  REGRESSION {name}: {base:g} -> {value:g} ({change:+.0%})')
+        if regressions:
+            sys.exit(1)
+        print('  no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Search latency: LIKE '%term%' scans vs FTS5 vs the in-process prefix index.
+
+Loads --students generated students (plus courses and instructors), builds
+each index, then runs the same mix of typeahead prefixes and multi-word
+queries against every backend.
+
+    python -m benchmarks.bench_search --students 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def queries(rng, count):
+    from datagen import FIRST_NAMES, LAST_NAMES, SUBJECTS
+    words = FIRST_NAMES + LAST_NAMES + SUBJECTS
+    result = []
+    for _ in range(count):
+        word = rng.choice(words).lower()
+        shape = rng.random()
+        if shape < 0.1:
+            # A typo matches nothing, the worst case for a scan
+            result.append(word[::-1])
+        elif shape < 0.4:
+            # Typeahead after a couple of keystrokes
+            result.append(word[:rng.randint(2, 4)])
+        elif shape < 0.7:
+            result.append(word)
+        else:
+            result.append(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:3]}')
+    return result
+
+
+def timed(label, db, fn, sample):
+    latencies = []
+    found = 0
+    for query in sample:
+        started = time.perf_counter()
+        found += len(fn(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{label:<28} p50 {statistics.median(latencies):8.3f} ms  p95 {p95:8.3f} ms  '
+          f'max {latencies[-1]:8.3f} ms  ({found / len(sample):.1f} hits avg)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-search-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from main import app, db
+    from datagen import DatasetSpec, bulk_load, generate_courses, generate_instructors, generate_students
+    from models import Student, Course, Instructor
+    from search import build_fts_index, fts_search, like_search, load_prefix_index, tokenize
+
+    spec = DatasetSpec(students=args.students, courses=2000, instructors=1000)
+    sample = queries(random.Random(7), args.queries)
+    with app.app_context():
+        db.create_all()
+        for table, generate in [(Student.__table__, generate_students),
+                                (Instructor.__table__, generate_instructors),
+                                (Course.__table__, generate_courses)]:
+            bulk_load(db.engine, table, generate(spec))
+
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            build_fts_index(conn)
+        print(f'Built FTS5 index in {time.perf_counter() - started:.2f}s')
+        started = time.perf_counter()
+        prefix_index = load_prefix_index()
+        print(f'Built prefix index of {len(prefix_index):,} documents in {time.perf_counter() - started:.2f}s\n')
+
+        limit = args.limit
+        timed('LIKE scan', db, lambda q: like_search(tokenize(q), limit=limit), sample)
+        timed('FTS5, ranked', db, lambda q: fts_search(tokenize(q), limit=limit), sample)
+        timed('FTS5, typeahead', db, lambda q: fts_search(tokenize(q), limit=limit, ranked=False), sample)
+        timed('prefix index', db, lambda q: prefix_index.search(tokenize(q), limit=limit), sample)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Worker startup: time to first request, per-worker imports vs a preloaded master.
+
+Runs gunicorn with one worker in each mode and measures
+  - import: `import main` in a fresh interpreter
+  - cold start: launching gunicorn until the first page is served
+  - respawn: SIGKILLing the worker until its replacement serves a page,
+    which every crash, --max-requests recycle and scale-up pays
+'per-worker' imports the app in each worker, as gunicorn does without
+preload_app; 'preload' uses the repository's gunicorn.conf.py. Needs a
+POSIX system (fork, SIGKILL).
+
+    python -m benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import http.client
+import os
+import queue
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BOOTING = re.compile(r'Booting worker with pid: (\d+)')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def first_response(port, path, timeout=60):
+    """Seconds until `path` answers 200, retrying while nothing is listening"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        try:
+            conn.request('GET', path)
+            if conn.getresponse().status == 200:
+                return time.perf_counter() - started
+        except (ConnectionError, http.client.HTTPException, socket.timeout):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.002)
+    raise RuntimeError(f'{path} did not answer within {timeout}s')
+
+
+class Server:
+    """gunicorn in the background, with worker pids read from its log"""
+
+    def __init__(self, config, env):
+        self.port = free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'main:app', '-c', config, '-w', '1',
+             '-b', f'127.0.0.1:{self.port}', '--log-level', 'info'],
+            env=env, stderr=subprocess.PIPE, text=True)
+        self.workers = queue.Queue()
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.process.stderr:
+            match = BOOTING.search(line)
+            if match:
+                self.workers.put(int(match.group(1)))
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def import_time(env):
+    code = 'import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)'
+    return float(subprocess.run([sys.executable, '-c', code], env=env, capture_output=True,
+                                text=True, check=True).stdout)
+
+
+def summary(label, seconds):
+    ms = sorted(s * 1000 for s in seconds)
+    print(f'  {label:<12} median {statistics.median(ms):8.1f} ms   min {ms[0]:8.1f} ms   max {ms[-1]:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--path', default='/students/1', help='Page requested after each start')
+    parser.add_argument('--modes', nargs='+', choices=['per-worker', 'preload'], default=['per-worker', 'preload'])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'), PYTHONPATH=os.getcwd())
+    os.environ.update(env)
+    from main import app, db
+    from datagen import DatasetSpec, load_dataset
+    from migrations import upgrade
+
+    with app.app_context():
+        upgrade(db.engine)
+        load_dataset(db.engine, DatasetSpec(students=1000))
+        db.engine.dispose()
+    configs = {'preload': os.path.join(os.getcwd(), 'gunicorn.conf.py'),
+               'per-worker': os.path.join(workdir, 'per_worker.conf.py')}
+    with open(configs['per-worker'], 'w') as out:
+        out.write('preload_app = False\n')
+
+    summary('import main', [import_time(env) for _ in range(args.repeat)])
+    for mode in args.modes:
+        print(mode)
+        cold, respawn = [], []
+        for _ in range(args.repeat):
+            server = Server(configs[mode], env)
+            try:
+                cold.append(first_response(server.port, args.path))
+                os.kill(server.workers.get(timeout=30), signal.SIGKILL)
+                respawn.append(first_response(server.port, args.path))
+            finally:
+                server.stop()
+        summary('cold start', cold)
+        summary('respawn', respawn)
+
+
+if __name__ == '__main__':
+    main()
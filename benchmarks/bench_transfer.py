@@ -0,0 +1,94 @@
+"""Bulk enrollment import and export: rows/sec and peak RSS at registrar-file sizes.
+
+Generates students, courses and sections, writes --rows enrollments to a
+CSV (a small share of them invalid), then runs import-enrollments twice
+(all inserts, then all updates) and export-enrollments to CSV and, if
+pyarrow is installed, Parquet. Every step runs as its own `flask` process
+so its peak RSS is measured in isolation.
+
+    python -m benchmarks.bench_transfer --rows 5000000
+"""
+import argparse
+import csv
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def write_enrollments(path, spec, bad_share, seed=11):
+    from datagen import generate_enrollments
+    rng = random.Random(seed)
+    count = 0
+    with open(path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['student_number', 'section_identifier', 'grade'])
+        for row in generate_enrollments(spec):
+            student, section = row['student_number'], row['section_identifier']
+            if rng.random() < bad_share:
+                # Unknown student or section, as in a file exported from another term's roster
+                if rng.random() < 0.5:
+                    student += spec.students
+                else:
+                    section += spec.terms * spec.sections_per_term
+            writer.writerow([student, section, row['grade']])
+            count += 1
+    return count
+
+
+def flask(env, *args):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', *args],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    # The commands print a one-line summary with rows/sec and peak RSS
+    summary = [line for line in (result.stdout + result.stderr).splitlines() if line.startswith(('Imported', 'Exported'))]
+    print(f'{" ".join(args[:1]):<20} {summary[-1] if summary else ""}  [{time.perf_counter() - started:.1f}s wall]')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--bad-share', type=float, default=0.001, help='Fraction of rows with an unknown key')
+    parser.add_argument('--chunk-size', type=int, default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-transfer-')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'), PYTHONPATH=os.getcwd())
+    os.environ.update(env)
+    from main import app, db
+    from datagen import DatasetSpec, bulk_load, generate_courses, generate_instructors, generate_sections, \
+        generate_students
+    from models import Student, Course, Instructor, Section
+    from transfer import parquet_available
+
+    spec = DatasetSpec(students=max(args.rows // 8, 1), courses=2000, instructors=500, terms=12,
+                       sections_per_term=1000, enrollments_per_student=8)
+    with app.app_context():
+        db.create_all()
+        for table, generate in [(Student.__table__, generate_students),
+                                (Instructor.__table__, generate_instructors),
+                                (Course.__table__, generate_courses),
+                                (Section.__table__, generate_sections)]:
+            bulk_load(db.engine, table, generate(spec))
+    source = os.path.join(workdir, 'enrollments.csv')
+    started = time.perf_counter()
+    rows = write_enrollments(source, spec, args.bad_share)
+    print(f'Wrote {rows:,} enrollments ({os.path.getsize(source) / 2 ** 20:,.0f} MiB) '
+          f'in {time.perf_counter() - started:.1f}s to {source}\n')
+
+    chunk = ['--chunk-size', str(args.chunk_size)] if args.chunk_size else []
+    flask(env, 'import-enrollments', source, '--quiet', *chunk)
+    flask(env, 'import-enrollments', source, '--quiet', *chunk)
+    flask(env, 'export-enrollments', os.path.join(workdir, 'export.csv'))
+    if parquet_available():
+        flask(env, 'export-enrollments', os.path.join(workdir, 'export.parquet'))
+    else:
+        print('pyarrow is not installed; skipping Parquet export')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context, jsonify, make_response, request
+from sqlalchemy import event, inspect
+from models import db, Student, Course, Instructor, Section, Enrollment
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 300
+
+
+def shared_cache_path(database_url):
+    """Where servers on this machine share the 'auto' cache for `database_url`
+
+    One file per database, so CLI commands that write around the ORM can
+    clear the cache the running workers use.
+    """
+    digest = hashlib.sha1(database_url.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'response-cache-{digest}.db')
+
+
+class MemoryBackend:
+    """In-process LRU keyed by request path, with a size cap and per-entry TTL
+
+    Each entry carries a set of dependency tags ('course:101', 'sections', ...)
+    so writes can drop exactly the pages that showed the changed rows. Every
+    invalidation bumps generation(), so a page rendered across one is not
+    stored.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, tags, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def generation(self):
+        return self._generation
+
+    def set(self, key, value, tags, generation=None):
+        """Store `value`, unless an invalidation happened since `generation`"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, tags, time.monotonic() + self.ttl)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        """Drop every entry carrying any of `tags`; returns how many were removed"""
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class SQLiteBackend:
+    """Shared LRU in a local SQLite file, so every gunicorn worker sees the same entries
+
+    Invalidations made by one worker take effect for all of them, and the
+    generation counter lives in the file too, so a page one worker rendered
+    while another committed a change is not stored. Hits refresh an entry's
+    LRU timestamp at most once per `touch_interval` seconds rather than
+    writing on every read.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, touch_interval=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = ttl / 10 if touch_interval is None else touch_interval
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Connections must not cross a fork, so each worker opens its own
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                               'key TEXT PRIMARY KEY, body BLOB, mimetype TEXT, expires REAL, accessed REAL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT, key TEXT, PRIMARY KEY (tag, key))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_tags_key ON cache_tags (key)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER)')
+            self._conn.execute("INSERT OR IGNORE INTO cache_meta VALUES ('generation', 0)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('SELECT body, mimetype, expires, accessed FROM cache_entries WHERE key = ?',
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            if row[2] < now:
+                self._delete_keys(conn, [key])
+                return None
+            if now - row[3] > self.touch_interval:
+                conn.execute('UPDATE cache_entries SET accessed = ? WHERE key = ?', (now, key))
+            return row[0], row[1]
+
+    def generation(self):
+        with self._lock:
+            return self._generation(self._connection())
+
+    def set(self, key, value, tags, generation=None):
+        """Store `value`, unless an invalidation happened since `generation`"""
+        now = time.time()
+        body, mimetype = value
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if generation is not None and generation != self._generation(conn):
+                    conn.execute('ROLLBACK')
+                    return
+                conn.execute('DELETE FROM cache_tags WHERE key = ?', (key,))
+                conn.execute('INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)',
+                             (key, body, mimetype, now + self.ttl, now))
+                conn.executemany('INSERT OR IGNORE INTO cache_tags VALUES (?, ?)', [(tag, key) for tag in tags])
+                excess = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0] - self.max_entries
+                if excess > 0:
+                    oldest = [r[0] for r in conn.execute(
+                        'SELECT key FROM cache_entries ORDER BY accessed LIMIT ?', (excess,))]
+                    self._delete_keys(conn, oldest)
+                    self.evictions += len(oldest)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        if not tags:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            marks = ','.join('?' * len(tags))
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._bump_generation(conn)
+                keys = [r[0] for r in conn.execute(f'SELECT DISTINCT key FROM cache_tags WHERE tag IN ({marks})', tags)]
+                self._delete_keys(conn, keys)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._bump_generation(conn)
+                conn.execute('DELETE FROM cache_entries')
+                conn.execute('DELETE FROM cache_tags')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _generation(self, conn):
+        return conn.execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()[0]
+
+    def _bump_generation(self, conn):
+        conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'generation'")
+
+    def _delete_keys(self, conn, keys):
+        rows = [(key,) for key in keys]
+        conn.executemany('DELETE FROM cache_entries WHERE key = ?', rows)
+        conn.executemany('DELETE FROM cache_tags WHERE key = ?', rows)
+
+
+def _values(obj, attr):
+    """Current and pre-flush values of an attribute, so moves invalidate both sides"""
+    history = inspect(obj).attrs[attr].history
+    return (set(history.added) | set(history.unchanged) | set(history.deleted)) - {None}
+
+
+def tags_for(obj):
+    """Cache tags made stale by a write to `obj`"""
+    if isinstance(obj, Student):
+        return {f'student:{n}' for n in _values(obj, 'student_number')}
+    if isinstance(obj, Course):
+        related = _values(obj, 'course_number') | _values(obj, 'prerequisite')
+        return {f'course:{n}' for n in related} | {'courses'}
+    if isinstance(obj, Instructor):
+        return {f'instructor:{n}' for n in _values(obj, 'instructor_name')}
+    if isinstance(obj, Section):
+        return ({f'section:{n}' for n in _values(obj, 'section_identifier')}
+                | {f'instructor:{n}' for n in _values(obj, 'instructor_name')}
+                | {'sections'})
+    if isinstance(obj, Enrollment):
+        return ({f'student:{n}' for n in _values(obj, 'student_number')}
+                | {f'section:{n}' for n in _values(obj, 'section_identifier')}
+                | {'enrollments'})
+    return set()
+
+
+class ResponseCache:
+    """Caches rendered view responses and drops them when the rows behind them change
+
+    Backend comes from RESPONSE_CACHE_BACKEND: 'memory', a 'sqlite:///path'
+    store shared between workers, 'none' to disable, or 'auto' (default).
+    'auto' starts as 'memory', which only invalidates entries in the process
+    that made the change; gunicorn.conf.py switches every worker to the
+    shared_cache_path() store with use_shared_backend(), and clear() in a
+    CLI command reaches that store too.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.configured = 'auto'
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+        spec = self.configured = app.config.get('RESPONSE_CACHE_BACKEND', 'auto')
+        self.shared_path = shared_cache_path(app.config.get('SQLALCHEMY_DATABASE_URI', ''))
+        if spec in ('auto', 'memory'):
+            self.backend = MemoryBackend(self.max_entries, self.ttl)
+        elif spec.startswith('sqlite:///'):
+            self.backend = SQLiteBackend(spec[len('sqlite:///'):], self.max_entries, self.ttl)
+        elif spec != 'none':
+            raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND {spec!r}')
+        app.extensions['response_cache'] = self
+        app.add_url_rule('/cache/stats', 'cache_stats', self.stats_view)
+
+    def use_shared_backend(self):
+        """Move an 'auto' cache to the SQLite file at shared_path that every worker shares
+
+        Returns True if it switched; explicitly configured backends are kept.
+        """
+        if self.configured != 'auto':
+            return False
+        self.backend = SQLiteBackend(self.shared_path, self.max_entries, self.ttl)
+        return True
+
+    def cached(self, tags):
+        """Decorate a view so its 200 responses are cached under `tags(**view_args)`"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                if self.backend is None:
+                    return view(**kwargs)
+                key = request.full_path
+                value = self.backend.get(key)
+                if value is not None:
+                    self.hits += 1
+                    response = current_app.response_class(value[0], mimetype=value[1])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                self.misses += 1
+                generation = self.backend.generation()
+                response = make_response(view(**kwargs))
+                # The backend skips storing if any worker invalidated anything while we rendered
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(key, (response.get_data(), response.mimetype), tags(**kwargs), generation)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, tags):
+        if self.backend is not None and tags:
+            self.invalidations += self.backend.invalidate(tags)
+
+    def clear(self):
+        """Drop every entry, including the shared store of servers using 'auto'"""
+        if self.backend is not None:
+            self.backend.clear()
+        if (self.configured == 'auto' and not isinstance(self.backend, SQLiteBackend)
+                and os.path.exists(self.shared_path)):
+            SQLiteBackend(self.shared_path).clear()
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'entries': len(self.backend) if self.backend else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions if self.backend else 0,
+            'invalidations': self.invalidations,
+        }
+
+    def stats_view(self):
+        return jsonify(self.stats())
+
+
+# Tags are gathered at flush time, while attribute history is still available,
+# and only applied once the transaction actually commits.
+@event.listens_for(db.session, 'after_flush')
+def _collect_stale_tags(session, flush_context):
+    tags = session.info.setdefault('response_cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags |= tags_for(obj)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    tags = session.info.pop('response_cache_tags', None)
+    if tags and has_app_context():
+        cache = current_app.extensions.get('response_cache')
+        if cache is not None:
+            cache.invalidate(tags)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('response_cache_tags', None)
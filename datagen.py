@@ -0,0 +1,283 @@
+import csv
+import io
+import random
+import time
+import click
+from datetime import date, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Student, Course, Instructor, Section, Enrollment
+from migrations import upgrade
+
+FIRST_NAMES = [
+    'Emily', 'James', 'Sarah', 'Michael', 'Ashley', 'David', 'Jessica', 'Christopher',
+    'Amanda', 'Ryan', 'Lauren', 'Kevin', 'Natalie', 'Brandon', 'Victoria', 'Daniel',
+    'Olivia', 'Ethan', 'Sophia', 'Noah', 'Priya', 'Wei', 'Fatima', 'Mateo', 'Aisha',
+    'Lucas', 'Chloe', 'Omar', 'Hannah', 'Diego', 'Grace', 'Samuel', 'Yuki', 'Isabella',
+]
+LAST_NAMES = [
+    'Rodriguez', 'Thompson', 'Kim', "O'Connor", 'Martinez', 'Anderson', 'Wong', 'Lee',
+    'Taylor', 'Johnson', 'Brown', 'Chen', 'Davis', 'Wilson', 'Garcia', 'Patel', 'Nguyen',
+    'Miller', 'Singh', 'Khan', 'Lopez', 'Clark', 'Lewis', 'Walker', 'Hall', 'Young',
+    'Allen', 'Wright', 'Scott', 'Adams', 'Baker', 'Nelson', 'Hill', 'Ramirez',
+]
+TITLES = ['Dr.', 'Prof.']
+SUBJECTS = [
+    'Computer Science', 'Mathematics', 'Statistics', 'Physics', 'Chemistry', 'Biology',
+    'Economics', 'Psychology', 'History', 'Philosophy', 'Linguistics', 'Engineering',
+]
+TOPICS = [
+    'Foundations', 'Methods', 'Systems', 'Theory', 'Applications', 'Analysis',
+    'Design', 'Modeling', 'Seminar', 'Laboratory', 'Topics', 'Practicum',
+]
+SEMESTERS = ['Spring', 'Summer', 'Fall']
+# Roughly the shape of an undergraduate grade distribution
+GRADE_WEIGHTS = [
+    ('A', 15), ('A-', 12), ('B+', 14), ('B', 16), ('B-', 10), ('C+', 9),
+    ('C', 8), ('C-', 5), ('D', 5), ('F', 4), ('W', 2),
+]
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+class DatasetSpec:
+    """Sizes and seed for a generated dataset; the same spec always yields the same rows"""
+
+    def __init__(self, students=10000, courses=500, instructors=200, terms=8,
+                 sections_per_term=400, enrollments_per_student=8, first_year=2018, seed=42):
+        self.students = students
+        self.courses = courses
+        self.instructors = instructors
+        self.terms = terms
+        self.sections_per_term = sections_per_term
+        self.enrollments_per_student = enrollments_per_student
+        self.first_year = first_year
+        self.seed = seed
+
+    def instructor_name(self, i):
+        # Title and surname come from the index so names stay unique at any size
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        return f'{TITLES[i % 2]} {first} {last} {i}'
+
+    def term(self, index):
+        return SEMESTERS[index % len(SEMESTERS)], self.first_year + index // len(SEMESTERS)
+
+
+def generate_students(spec):
+    rng = random.Random(spec.seed)
+    oldest = date(1995, 1, 1)
+    for number in range(1, spec.students + 1):
+        yield {
+            'student_number': number,
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'dob': oldest + timedelta(days=rng.randrange(365 * 10)),
+        }
+
+
+def generate_instructors(spec):
+    for i in range(spec.instructors):
+        yield {'instructor_name': spec.instructor_name(i)}
+
+
+def course_numbers(spec):
+    """Course numbers split into four levels; the thousands digit is the level"""
+    per_level = max(spec.courses // 4, 1)
+    return [(min(i // per_level, 3) + 1) * 1000 + i for i in range(spec.courses)]
+
+
+def generate_courses(spec):
+    """Each course above the first level may require a course from the level below"""
+    rng = random.Random(spec.seed + 1)
+    by_level = {}
+    for number in course_numbers(spec):
+        level = number // 1000
+        prerequisite = None
+        lower = by_level.get(level - 1)
+        if lower and rng.random() < 0.75:
+            prerequisite = rng.choice(lower)
+        by_level.setdefault(level, []).append(number)
+        yield {
+            'course_number': number,
+            'course_name': f'{rng.choice(SUBJECTS)} {rng.choice(TOPICS)} {number}',
+            'credit_hours': rng.choice([1, 2, 3, 3, 3, 4, 4]),
+            'prerequisite': prerequisite,
+        }
+
+
+def generate_sections(spec):
+    """Sections are numbered consecutively term by term, so each term owns a contiguous id range"""
+    rng = random.Random(spec.seed + 2)
+    courses = course_numbers(spec)
+    identifier = 1
+    for term_index in range(spec.terms):
+        semester, year = spec.term(term_index)
+        for _ in range(spec.sections_per_term):
+            yield {
+                'section_identifier': identifier,
+                'course_number': rng.choice(courses),
+                'instructor_name': spec.instructor_name(rng.randrange(spec.instructors)),
+                'semester': semester,
+                'year': year,
+            }
+            identifier += 1
+
+
+def generate_enrollments(spec):
+    """Each student enrolls in distinct sections drawn from a window of consecutive terms"""
+    rng = random.Random(spec.seed + 3)
+    grades = [grade for grade, _ in GRADE_WEIGHTS]
+    cum_weights = []
+    total = 0
+    for _, weight in GRADE_WEIGHTS:
+        total += weight
+        cum_weights.append(total)
+    window_terms = min(spec.terms, 8)
+    per_student = min(spec.enrollments_per_student, window_terms * spec.sections_per_term)
+    enrollment_id = 1
+    for student in range(1, spec.students + 1):
+        start_term = rng.randrange(spec.terms - window_terms + 1)
+        first = start_term * spec.sections_per_term + 1
+        window = range(first, first + window_terms * spec.sections_per_term)
+        for section in sorted(rng.sample(window, per_student)):
+            yield {
+                'enrollment_id': enrollment_id,
+                'student_number': student,
+                'section_identifier': section,
+                'grade': rng.choices(grades, cum_weights=cum_weights)[0],
+            }
+            enrollment_id += 1
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_chunk(conn, table, chunk):
+    """Postgres COPY FROM STDIN for one chunk; returns False if the driver can't do it"""
+    cursor = conn.connection.driver_connection.cursor()
+    if not hasattr(cursor, 'copy_expert'):
+        return False
+    columns = list(chunk[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chunk:
+        writer.writerow(['' if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv, NULL \'\')', buffer)
+    return True
+
+
+def bulk_load(engine, table, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Insert an iterable of row dicts in chunks; returns (row_count, seconds)
+
+    Uses COPY on Postgres when the driver supports it and executemany
+    otherwise. SQLite loads run with synchronous=OFF for the duration of
+    the load connection only.
+    """
+    started = time.perf_counter()
+    count = 0
+    with engine.connect() as conn:
+        sqlite = conn.dialect.name == 'sqlite'
+        if sqlite:
+            synchronous = conn.exec_driver_sql('PRAGMA synchronous').scalar()
+            conn.exec_driver_sql('PRAGMA synchronous=OFF')
+            conn.commit()
+        try:
+            with conn.begin():
+                use_copy = conn.dialect.name == 'postgresql'
+                for chunk in _chunks(rows, chunk_size):
+                    if not (use_copy and _copy_chunk(conn, table, chunk)):
+                        use_copy = False
+                        conn.execute(table.insert(), chunk)
+                    count += len(chunk)
+        finally:
+            if sqlite:
+                # The connection goes back to the pool; don't leave it unsafe
+                conn.exec_driver_sql(f'PRAGMA synchronous={synchronous}')
+                conn.commit()
+    return count, time.perf_counter() - started
+
+
+def load_dataset(engine, spec, chunk_size=DEFAULT_CHUNK_SIZE, drop_indexes=True, report=None):
+    """Generate and load every table for `spec`; returns {table name: (rows, seconds)}
+
+    Secondary indexes are dropped before the load and rebuilt afterwards
+    unless `drop_indexes` is False, which is far cheaper than maintaining
+    them row by row.
+    """
+    plan = [
+        (Student.__table__, generate_students),
+        (Instructor.__table__, generate_instructors),
+        (Course.__table__, generate_courses),
+        (Section.__table__, generate_sections),
+        (Enrollment.__table__, generate_enrollments),
+    ]
+    indexes = [index for table, _ in plan for index in table.indexes] if drop_indexes else []
+    for index in indexes:
+        index.drop(engine, checkfirst=True)
+    results = {}
+    for table, generate in plan:
+        results[table.name] = bulk_load(engine, table, generate(spec), chunk_size)
+        if report:
+            report(table.name, *results[table.name])
+    if indexes:
+        started = time.perf_counter()
+        for index in indexes:
+            index.create(engine, checkfirst=True)
+        results['indexes'] = (len(indexes), time.perf_counter() - started)
+    return results
+
+
+@click.command('generate-data')
+@click.option('--students', default=10000, show_default=True)
+@click.option('--courses', default=500, show_default=True)
+@click.option('--instructors', default=200, show_default=True)
+@click.option('--terms', default=8, show_default=True, help='Number of consecutive terms with sections.')
+@click.option('--sections-per-term', default=400, show_default=True)
+@click.option('--enrollments-per-student', default=8, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows per insert batch.')
+@click.option('--keep-indexes', is_flag=True, help='Maintain secondary indexes during the load.')
+@click.option('--reset', is_flag=True, help='Drop and recreate all tables first.')
+@with_appcontext
+def generate_data_command(students, courses, instructors, terms, sections_per_term,
+                          enrollments_per_student, seed, chunk_size, keep_indexes, reset):
+    """Generate a reproducible synthetic dataset and bulk-load it."""
+    if reset:
+        db.drop_all()
+    # Creates the tables on a fresh database (or after --reset) and applies migrations
+    upgrade(db.engine)
+    if not reset and db.session.query(Student.student_number).first() is not None:
+        raise click.ClickException('Database already has data; rerun with --reset to replace it')
+    spec = DatasetSpec(students=students, courses=courses, instructors=instructors, terms=terms,
+                       sections_per_term=sections_per_term,
+                       enrollments_per_student=enrollments_per_student, seed=seed)
+
+    def report(name, rows, seconds):
+        click.echo(f'{name:<12} {rows:>12,} rows in {seconds:7.2f}s  ({rows / max(seconds, 1e-9):,.0f} rows/sec)')
+
+    results = load_dataset(db.engine, spec, chunk_size, drop_indexes=not keep_indexes, report=report)
+    if 'indexes' in results:
+        count, seconds = results['indexes']
+        click.echo(f'Rebuilt {count} indexes in {seconds:.2f}s')
+    # Running workers drop their registration indexes once they meet a
+    # recreated section, or at the next rebuild; the response cache shared
+    # under 'auto' can be emptied from here
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.clear()
+    # Bulk inserts bypass the session events that keep search up to date
+    search_index = current_app.extensions.get('search_index')
+    if search_index is not None:
+        started = time.perf_counter()
+        backend = search_index.rebuild()
+        click.echo(f'Rebuilt {backend} search index in {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,89 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def _env_bool(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(database_url, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url`, tunable per worker from the environment
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds), DB_POOL_RECYCLE
+    (seconds), DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS (Postgres and
+    MySQL only; 0 disables it).
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    options = {
+        'pool_pre_ping': _env_bool(environ, 'DB_POOL_PRE_PING', True),
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 1800),
+    }
+    # In-memory SQLite uses a singleton-per-thread pool that has no size or overflow
+    if not (backend == 'sqlite' and url.database in (None, '', ':memory:')):
+        options['pool_size'] = _env_int(environ, 'DB_POOL_SIZE', 5)
+        options['max_overflow'] = _env_int(environ, 'DB_MAX_OVERFLOW', 10)
+        options['pool_timeout'] = _env_int(environ, 'DB_POOL_TIMEOUT', 30)
+
+    statement_timeout = _env_int(environ, 'DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and backend == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    elif statement_timeout and backend == 'mysql':
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={statement_timeout}'}
+    return options
+
+
+# Drivers the async entry point swaps in for each backend
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+def async_database_url(database_url):
+    """The same database through its asyncio driver (aiosqlite or asyncpg)"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(database_url, environ=os.environ):
+    """engine_options() for create_async_engine; asyncpg takes the statement timeout as a server setting"""
+    options = engine_options(database_url, environ)
+    options.pop('connect_args', None)
+    if 'pool_size' in options and make_url(database_url).get_backend_name() == 'sqlite':
+        # aiosqlite defaults to NullPool, which opens a connection and a thread per checkout
+        options['poolclass'] = AsyncAdaptedQueuePool
+    statement_timeout = _env_int(environ, 'DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and make_url(database_url).get_backend_name() == 'postgresql':
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout)}}
+    return options
+
+
+def install_sqlite_pragmas(engine, environ=os.environ):
+    """Put every new SQLite connection in WAL mode with a busy timeout
+
+    WAL lets readers carry on while a writer commits, and busy_timeout makes
+    concurrent writers wait (DB_SQLITE_BUSY_TIMEOUT_MS, default 5000) rather
+    than fail immediately with "database is locked".
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    busy_timeout = _env_int(environ, 'DB_SQLITE_BUSY_TIMEOUT_MS', 5000)
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
@@ -0,0 +1,68 @@
+import logging
+import sys
+import time
+
+# Picked up automatically by `gunicorn main:app` (and `asgi:app`) run from
+# this directory. Settings such as bind and workers keep gunicorn's
+# defaults, which already honour $PORT and $WEB_CONCURRENCY.
+
+# Import the app once in the master and fork workers from it, so a worker
+# (re)spawn skips importing Flask, SQLAlchemy and the models. Code changes
+# need a full restart: SIGHUP reuses the preloaded app.
+preload_app = True
+
+logger = logging.getLogger('gunicorn.error')
+
+
+def share_response_cache():
+    """Give every worker the same response cache, so a write invalidates pages in all of them
+
+    The store is per database rather than per server, so import and
+    generate-data commands can clear it too.
+    """
+    from main import response_cache
+    if response_cache.use_shared_backend():
+        logger.info('Response cache shared by all workers in %s', response_cache.shared_path)
+        return True
+    return False
+
+
+def when_ready(server):
+    """In the master, after the app is loaded and before any worker is forked"""
+    if not server.cfg.preload_app:
+        return
+    from main import app, db, precompile_templates, schema_check
+    if share_response_cache():
+        # Entries left by an earlier run may predate writes made since
+        from main import response_cache
+        response_cache.clear()
+    with app.app_context():
+        precompile_templates(app.jinja_env)
+        if 'asgi' in sys.modules:
+            precompile_templates(sys.modules['asgi'].templates)
+        schema_check.verify()
+        # The schema check connected; children must not inherit that socket
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    if 'main' not in sys.modules:
+        return
+    # Belt and braces for anything the master connected after when_ready:
+    # drop inherited pooled connections without closing the parent's sockets
+    from main import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+    # asgi's async engine needs nothing here: the master never connects it
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        # Each worker imported the app itself, so each checks the schema once
+        from main import app, schema_check
+        share_response_cache()
+        with app.app_context():
+            schema_check.verify()
+    logger.info('Worker %s ready %.0f ms after fork', worker.pid, (time.perf_counter() - worker.forked_at) * 1000)
+
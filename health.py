@@ -0,0 +1,72 @@
+import time
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+from models import db
+
+health = Blueprint('health', __name__)
+
+
+def pool_status(engine, max_overflow=None):
+    """Checked-in/out and overflow counts, for pools that track them
+
+    `max_overflow` is the value the engine was configured with, from
+    SQLALCHEMY_ENGINE_OPTIONS; without it the pool is never reported
+    exhausted.
+    """
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if method is not None:
+            status[name] = method()
+    if 'overflow' in status:
+        # QueuePool counts overflow from -size while the pool is filling up;
+        # report only connections opened beyond the pool size
+        status['overflow'] = max(0, status['overflow'])
+    if max_overflow is not None and 'size' in status:
+        status['max_overflow'] = max_overflow
+        # A negative max_overflow means the pool can grow without bound
+        status['exhausted'] = max_overflow >= 0 and status['checkedout'] >= status['size'] + max_overflow
+    else:
+        status['exhausted'] = False
+    return status
+
+
+def ping(engine):
+    """Round-trip SELECT 1 on its own connection; returns latency in milliseconds"""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    return (time.perf_counter() - started) * 1000
+
+
+@health.route('/healthz')
+def liveness():
+    """The process is up and serving requests; never touches the database"""
+    return jsonify(status='alive')
+
+
+@health.route('/readyz')
+def readiness():
+    """Ready only if a pooled connection is free and the database answers
+
+    The pool is checked before pinging, so a worker whose pool is exhausted
+    answers 503 straight away instead of blocking for pool_timeout. A
+    database missing migrations is not ready either.
+    """
+    engine = db.engine
+    max_overflow = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('max_overflow')
+    status = pool_status(engine, max_overflow)
+    if status['exhausted']:
+        return jsonify(status='unavailable', reason='connection pool exhausted', pool=status), 503
+    try:
+        latency = ping(engine)
+    except Exception:
+        # The driver's message can carry hosts and credentials; keep it in the log
+        current_app.logger.exception('Readiness ping failed')
+        return jsonify(status='unavailable', reason='database unreachable', pool=status), 503
+    schema_check = current_app.extensions.get('schema_check')
+    if schema_check is not None and not schema_check.up_to_date():
+        return jsonify(status='unavailable', reason='schema migrations pending', pool=status,
+                       schema_version=schema_check.version), 503
+    return jsonify(status='ready', ping_ms=round(latency, 3), pool=pool_status(engine, max_overflow))
@@ -1,4 +1,4 @@
-from main import app, db, Student, Course, Instructor, Section, Enrollment
+from main import app, db, response_cache, search_index, Student, Course, Instructor, Section, Enrollment
 from datetime import datetime, date
 
 def init_database():
@@ -7,6 +7,10 @@ def init_database():
         # Clear existing data
         db.drop_all()
         db.create_all()
+        # drop_all leaves the search index and cached pages behind; the
+        # session events keep both current for the rows added below
+        response_cache.clear()
+        search_index.rebuild()
         
         # Add sample students
         students = [
@@ -0,0 +1,210 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from models import db
+
+# Upper bounds in seconds; the last bucket catches everything slower
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_WINDOW_SECONDS = 60
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing is a bisect and two additions"""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q, other=None):
+        """Estimate the q-quantile, interpolating linearly inside the bucket it falls in"""
+        counts = self.counts if other is None else [a + b for a, b in zip(self.counts, other.counts)]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if BUCKETS[i] != float('inf') else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-2]
+
+
+class EndpointStats:
+    """Cumulative histograms for Prometheus plus a two-window rolling one for percentiles"""
+    __slots__ = ('total', 'sql', 'render', 'statements', 'current', 'previous', 'window_started')
+
+    def __init__(self):
+        self.total = Histogram()
+        self.sql = Histogram()
+        self.render = Histogram()
+        self.statements = 0
+        self.current = Histogram()
+        self.previous = Histogram()
+        self.window_started = time.monotonic()
+
+    def observe(self, timing, total, window):
+        now = time.monotonic()
+        if now - self.window_started > window:
+            self.previous = self.current if now - self.window_started < 2 * window else Histogram()
+            self.current = Histogram()
+            self.window_started = now
+        self.total.observe(total)
+        self.sql.observe(timing.sql)
+        self.render.observe(timing.render)
+        self.statements += timing.statements
+        self.current.observe(total)
+
+    def percentiles(self):
+        return {q: self.current.quantile(q, self.previous) for q in QUANTILES}
+
+
+class RequestTiming:
+    """Per-request accumulators; small and fixed-size so sampling a request costs little"""
+    __slots__ = ('started', 'statements', 'sql', 'render', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql = 0.0
+        self.render = 0.0
+        self.render_started = 0.0
+
+
+def _current_timing():
+    return g.get('_request_timing') if has_request_context() else None
+
+
+class Instrumentation:
+    """Times SQL, template rendering and whole requests, per endpoint
+
+    A METRICS_SAMPLE_RATE fraction of requests is measured (default all of
+    them). Measured requests get a Server-Timing header and feed the
+    histograms served at /metrics. Metrics are per process: with several
+    gunicorn workers each one reports its own share.
+    """
+
+    def __init__(self, app=None):
+        self.stats = {}
+        self.sample_rate = 1.0
+        self.window = DEFAULT_WINDOW_SECONDS
+        self.server_timing = True
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_rate = float(app.config.get('METRICS_SAMPLE_RATE', 1.0))
+        self.window = app.config.get('METRICS_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS)
+        self.server_timing = app.config.get('METRICS_SERVER_TIMING', True)
+        app.extensions['instrumentation'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _before_request(self):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            g._request_timing = RequestTiming()
+
+    def _after_request(self, response):
+        timing = g.pop('_request_timing', None)
+        if timing is None:
+            return response
+        total = time.perf_counter() - timing.started
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                stats = self.stats[endpoint] = EndpointStats()
+            stats.observe(timing, total, self.window)
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;dur={timing.sql * 1000:.2f};desc="{timing.statements} queries", '
+                f'render;dur={timing.render * 1000:.2f}, '
+                f'app;dur={(total - timing.sql - timing.render) * 1000:.2f};desc="view code and ORM hydration", '
+                f'total;dur={total * 1000:.2f}'
+            )
+        return response
+
+    def _before_render(self, sender, template, context, **extra):
+        timing = _current_timing()
+        if timing is not None:
+            timing.render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        timing = _current_timing()
+        if timing is not None and timing.render_started:
+            timing.render += time.perf_counter() - timing.render_started
+            timing.render_started = 0.0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _current_timing() is not None:
+            conn.info['query_started'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        timing = _current_timing()
+        started = conn.info.pop('query_started', None)
+        if timing is not None and started is not None:
+            timing.statements += 1
+            timing.sql += time.perf_counter() - started
+
+    def percentiles(self):
+        with self._lock:
+            return {endpoint: stats.percentiles() for endpoint, stats in self.stats.items()}
+
+    def render_metrics(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            items = sorted(self.stats.items())
+            histograms = [
+                ('http_request_duration_seconds', 'Request duration', 'total'),
+                ('http_request_sql_duration_seconds', 'Time spent in SQL per request', 'sql'),
+                ('http_request_render_duration_seconds', 'Time spent rendering templates per request', 'render'),
+            ]
+            for name, help_text, attr in histograms:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for endpoint, stats in items:
+                    histogram = getattr(stats, attr)
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+            lines.append('# HELP http_request_sql_statements_total SQL statements issued')
+            lines.append('# TYPE http_request_sql_statements_total counter')
+            for endpoint, stats in items:
+                lines.append(f'http_request_sql_statements_total{{endpoint="{endpoint}"}} {stats.statements}')
+            lines.append(f'# HELP http_request_duration_recent_seconds Request duration percentiles '
+                         f'over the last {self.window}-{2 * self.window}s')
+            lines.append('# TYPE http_request_duration_recent_seconds gauge')
+            for endpoint, stats in items:
+                for q, value in stats.percentiles().items():
+                    if value is not None:
+                        lines.append(f'http_request_duration_recent_seconds'
+                                     f'{{endpoint="{endpoint}",quantile="{q}"}} {value:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render_metrics(), mimetype='text/plain; version=0.0.4')
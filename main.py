@@ -1,49 +1,71 @@
-from flask import Flask, render_template
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
+from flask import Flask, abort, jsonify, render_template, request, url_for
+from sqlalchemy.orm import contains_eager
+from datetime import date
 import os
+from models import db, Student, Course, Instructor, Section, Enrollment
+from transcripts import student_transcript
+from pagination import page_size, render_listing
+from querycount import check_queries_command
+from migrations import SchemaCheck, db_upgrade_command, db_version_command, upgrade
+from datagen import generate_data_command
+from cache import ResponseCache
+from prereqs import PrerequisiteIndex
+from analytics import DIMENSIONS, gpa_by, gpa_page, grade_histogram, parse_key
+from api import api
+from health import health, ping
+from dbconfig import engine_options, install_sqlite_pragmas
+from instrumentation import Instrumentation
+from transfer import export_enrollments_command, import_enrollments_command
+from search import SOURCES as SEARCH_KINDS, SearchIndex, search_limit, search_reindex_command
+from registration import RegistrationEngine, registrations, set_capacity_command
 
 app = Flask(__name__, template_folder='templates')
 
 # Use environment variable for database URL, fallback to SQLite for cloud deployment
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///students.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-class Student(db.Model):
-    __tablename__ = 'students'
-    student_number = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), nullable=False)
-    dob = db.Column(db.Date, default=datetime.utcnow)
-
-class Course(db.Model):
-    __tablename__ = 'courses'
-    course_number = db.Column(db.Integer, primary_key=True)
-    course_name = db.Column(db.String(255), nullable=False)
-    credit_hours = db.Column(db.Integer)
-    prerequisite = db.Column(db.Integer, db.ForeignKey('courses.course_number'))
-
-class Instructor(db.Model):
-    __tablename__ = 'instructors'
-    instructor_name = db.Column(db.String(255), primary_key=True)
-
-class Section(db.Model):
-    __tablename__ = 'sections'
-    section_identifier = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    course_number = db.Column(db.Integer, db.ForeignKey('courses.course_number'))
-    instructor_name = db.Column(db.String(255), db.ForeignKey('instructors.instructor_name'))
-    semester = db.Column(db.String(50))
-    year = db.Column(db.Integer)
-    enrollments = db.relationship('Enrollment', backref='related_section')
-    course = db.relationship('Course', backref='sections')
-
-class Enrollment(db.Model):
-    __tablename__ = 'enrollments'
-    enrollment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    student_number = db.Column(db.Integer, db.ForeignKey('students.student_number'))
-    section_identifier = db.Column(db.Integer, db.ForeignKey('sections.section_identifier'))
-    grade = db.Column(db.String(5))
-    section = db.relationship('Section', back_populates='enrollments', overlaps="related_section")
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# 'memory' (per worker: a write only invalidates the worker that made it),
+# 'sqlite:///path/to/cache.db' (shared by all workers), 'none', or 'auto':
+# memory, switched to a shared file by gunicorn.conf.py when there are several workers
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'auto')
+app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+# Fraction of requests timed for Server-Timing headers and /metrics; 0 turns it off
+app.config['METRICS_SAMPLE_RATE'] = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+# 'auto' (FTS5 on SQLite, pg_trgm on Postgres, in-process otherwise), 'fts5', 'trigram', 'memory' or 'like'
+app.config['SEARCH_BACKEND'] = os.environ.get('SEARCH_BACKEND', 'auto')
+# 'warn' logs at boot if migrations are pending, 'strict' refuses to start
+app.config['SCHEMA_CHECK'] = os.environ.get('SCHEMA_CHECK', 'warn')
+# Seconds before the registration engine rebuilds a term's in-memory index from scratch
+app.config['REGISTRATION_INDEX_REFRESH'] = int(os.environ.get('REGISTRATION_INDEX_REFRESH', 300))
+db.init_app(app)
+with app.app_context():
+    install_sqlite_pragmas(db.engine)
+app.cli.add_command(check_queries_command)
+app.cli.add_command(db_upgrade_command)
+app.cli.add_command(db_version_command)
+app.cli.add_command(generate_data_command)
+app.cli.add_command(search_reindex_command)
+app.cli.add_command(import_enrollments_command)
+app.cli.add_command(export_enrollments_command)
+app.cli.add_command(set_capacity_command)
+response_cache = ResponseCache(app)
+prerequisite_index = PrerequisiteIndex(app)
+app.register_blueprint(api)
+app.register_blueprint(health)
+instrumentation = Instrumentation(app)
+search_index = SearchIndex(app)
+schema_check = SchemaCheck(app)
+app.register_blueprint(registrations)
+registration_engine = RegistrationEngine(app)
+
+
+def precompile_templates(env):
+    """Compile every template into `env`'s cache, e.g. in the gunicorn master before it forks"""
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+
 
 # Define routes
 @app.route('/')
@@ -52,50 +74,140 @@ def index():
 
 @app.route('/students/all')
 def students_all():
-    students = Student.query.all()
-    return render_template('students.html', students=students)
+    return render_listing('students.html', 'students', Student, Student.student_number)
 
 @app.route('/students/<int:id>')
+@response_cache.cached(lambda id: {f'student:{id}', 'sections', 'courses'})
 def student_detail(id):
     student = Student.query.get(id)
-    enrollments = Enrollment.query.join(Section, Enrollment.section_identifier == Section.section_identifier).join(Course, Section.course_number == Course.course_number).join(
-        Instructor, Section.instructor_name == Instructor.instructor_name).filter(Enrollment.student_number == id).all()
+    enrollments = student_transcript(id)
     return render_template('student_detail.html', student=student, enrollments=enrollments)
 
 
 @app.route('/instructors/<string:id>')
+@response_cache.cached(lambda id: {f'instructor:{id}', 'courses'})
 def instructor_detail(id):
     instructor = Instructor.query.get(id)
-    sections = Section.query.join(Course).filter_by(instructor_name=id).all()
+    sections = Section.query.join(Course).options(contains_eager(Section.course)).filter(Section.instructor_name == id).all()
     return render_template('instructor_detail.html', instructor=instructor, sections=sections)
 
 
 @app.route('/courses/all')
 def courses_all():
-    courses = Course.query.all()
-    return render_template('courses.html', courses=courses)
+    return render_listing('courses.html', 'courses', Course, Course.course_number)
 
 
 @app.route('/courses/<int:course_id>')
+@response_cache.cached(lambda course_id: {f'course:{course_id}'})
 def course_detail(course_id):
     course = Course.query.get(course_id)
     prerequisites = Course.query.filter_by(prerequisite=course_id).all()
     return render_template('course_detail.html', course=course, prerequisites=prerequisites)
 
 
+@app.route('/courses/<int:course_id>/prerequisites')
+def course_prerequisites(course_id):
+    chain = prerequisite_index.ancestors(course_id)
+    if chain is None:
+        abort(404)
+    return jsonify(course=course_id, prerequisites=chain, depth=len(chain))
+
+
+@app.route('/courses/<int:course_id>/unlocks')
+def course_unlocks(course_id):
+    unlocked = prerequisite_index.descendants(course_id)
+    if unlocked is None:
+        abort(404)
+    return jsonify(course=course_id, unlocks=unlocked)
+
+
+@app.route('/courses/order')
+def course_order():
+    graph = prerequisite_index.graph(wait=True)
+    return jsonify(order=graph.order, cycles=graph.cycles, dangling=graph.dangling)
+
+
+def analytics_key(dimension, name='key'):
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return None
+    try:
+        return parse_key(dimension, raw)
+    except ValueError:
+        abort(400, f'Invalid {dimension} {name}: {raw!r}')
+
+
+# Aggregates cover every enrollment, so any enrollment, section or course
+# write drops them; between writes they are served from the response cache
+ANALYTICS_TAGS = {'enrollments', 'sections', 'courses'}
+
+
+@app.route('/analytics/gpa/<string:dimension>')
+@response_cache.cached(lambda dimension: ANALYTICS_TAGS)
+def analytics_gpa(dimension):
+    if dimension not in DIMENSIONS:
+        abort(404)
+    key = analytics_key(dimension)
+    if key is not None:
+        return jsonify(dimension=dimension, groups=gpa_by(dimension, key))
+    groups, next_after = gpa_page(dimension, analytics_key(dimension, 'after'), page_size(request.args))
+    return jsonify(dimension=dimension, groups=groups, next_after=next_after)
+
+
+@app.route('/analytics/grades')
+@response_cache.cached(lambda: ANALYTICS_TAGS)
+def analytics_grades():
+    dimension = request.args.get('dimension')
+    if dimension is not None and dimension not in DIMENSIONS:
+        abort(400, f'Unknown dimension: {dimension!r}')
+    key = analytics_key(dimension) if dimension else None
+    return jsonify(dimension=dimension, key=request.args.get('key'), grades=grade_histogram(dimension, key))
+
+
+SEARCH_RESULT_ENDPOINTS = {
+    'student': ('student_detail', 'id'),
+    'course': ('course_detail', 'course_id'),
+    'instructor': ('instructor_detail', 'id'),
+}
+
+
+def search_results(limit, ranked):
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in SEARCH_KINDS:
+        abort(400, f'Unknown kind: {kind!r}')
+    results = search_index.search(request.args.get('q', ''), kind, limit, ranked)
+    for result in results:
+        endpoint, arg = SEARCH_RESULT_ENDPOINTS[result['kind']]
+        result['url'] = url_for(endpoint, **{arg: result['key']})
+    return kind, results
+
+
+@app.route('/search')
+def search():
+    kind, results = search_results(search_limit(request.args), ranked=True)
+    return render_template('search.html', query=request.args.get('q', ''), kind=kind,
+                           kinds=list(SEARCH_KINDS), results=results)
+
+
+@app.route('/search/suggest')
+def search_suggest():
+    """Typeahead: unranked prefix matches, cheap enough to call on every keystroke"""
+    _, results = search_results(search_limit(request.args, default=10), ranked=False)
+    return jsonify(query=request.args.get('q', ''), results=results)
+
+
 @app.route('/instructors/all')
 def instructors_all():
-    instructors = Instructor.query.all()
-    return render_template('instructors.html', instructors=instructors)
+    return render_listing('instructors.html', 'instructors', Instructor, Instructor.instructor_name)
 
 
 @app.route('/sections/all')
 def sections_all():
-    sections = Section.query.all()
-    return render_template('sections.html', sections=sections)
+    return render_listing('sections.html', 'sections', Section, Section.section_identifier)
 
 
 @app.route('/sections/<int:section_id>')
+@response_cache.cached(lambda section_id: {f'section:{section_id}'})
 def section_detail(section_id):
     section = Section.query.get(section_id)
     return render_template('section_detail.html', section=section)
@@ -104,10 +216,11 @@ def section_detail(section_id):
 @app.route('/test_db')
 def test_db():
     try:
-        db.session.query("1").from_statement("SELECT 1").all()
-        return 'Database is connected'
-    except:
-        return 'Something went wrong'
+        latency = ping(db.engine)
+        return f'Database is connected ({latency:.1f} ms)'
+    except Exception:
+        app.logger.exception('Database connection test failed')
+        return 'Database is unreachable; see the server log for details', 503
 
 
 @app.route('/init_db')
@@ -117,6 +230,9 @@ def init_database_route():
         # Clear existing data
         db.drop_all()
         db.create_all()
+        response_cache.clear()
+        search_index.rebuild()
+        registration_engine.reset()
         
         # Add comprehensive student data
         students = [
@@ -313,12 +429,10 @@ def init_database_route():
         return f'<h2>❌ Error initializing database:</h2><p style="color: red; font-family: monospace;">{str(e)}</p><p><a href="/">Back to Home</a></p>'
 
 
-
-# Create tables if they don't exist
-with app.app_context():
-    db.create_all()
-
 if __name__ == "__main__":
+    # Servers only check the schema at boot; the development server also brings it up to date
+    with app.app_context():
+        upgrade(db.engine)
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
 
@@ -0,0 +1,200 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+from models import db, Enrollment
+from search import create_search_index
+
+# Tracks which numbered migrations have been applied to this database.
+# Kept on its own MetaData so db.create_all()/drop_all() never touch it.
+version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255)),
+)
+
+
+def _model_index(name):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise LookupError(f'No index named {name} is declared on the models')
+
+
+# Indexes as a released migration created them, for indexes the models
+# have since changed. Kept on their own MetaData, like schema_version, so
+# they never reach db.create_all().
+released_metadata = MetaData()
+_enrollments_v1 = Table(
+    'enrollments', released_metadata,
+    Column('student_number', Integer),
+    Column('section_identifier', Integer),
+)
+# Migration 3 makes it unique
+ENROLLMENTS_STUDENT_SECTION_V1 = Index(
+    'ix_enrollments_student_section', _enrollments_v1.c.student_number, _enrollments_v1.c.section_identifier)
+
+
+def create_indexes(*indexes):
+    """Migration step that creates the given indexes if they are missing
+
+    Each one is an Index or the name of an index declared on the models.
+    """
+    def step(conn):
+        for index in indexes:
+            if isinstance(index, str):
+                index = _model_index(index)
+            index.create(conn, checkfirst=True)
+    return step
+
+
+def add_registration_constraints(conn):
+    """Migration step: unique (student, section) enrollments, section capacity and version
+
+    Stops with an error rather than choosing which of a duplicated pair of
+    enrollments to delete.
+    """
+    enrollments = Enrollment.__table__
+    duplicates = conn.execute(
+        select(func.count()).select_from(
+            select(enrollments.c.student_number, enrollments.c.section_identifier)
+            .where(enrollments.c.student_number.isnot(None), enrollments.c.section_identifier.isnot(None))
+            .group_by(enrollments.c.student_number, enrollments.c.section_identifier)
+            .having(func.count() > 1)
+            .subquery())
+    ).scalar()
+    if duplicates:
+        raise RuntimeError(f'{duplicates} (student_number, section_identifier) pairs are enrolled more than once; '
+                           f'remove the duplicates before upgrading')
+    index = _model_index('ix_enrollments_student_section')
+    inspector = inspect(conn)
+    existing = {i['name']: i for i in inspector.get_indexes('enrollments')}
+    if not existing.get(index.name, {}).get('unique'):
+        if index.name in existing:
+            index.drop(conn)
+        index.create(conn)
+    columns = {column['name'] for column in inspector.get_columns('sections')}
+    if 'capacity' not in columns:
+        conn.exec_driver_sql('ALTER TABLE sections ADD COLUMN capacity INTEGER')
+    if 'version' not in columns:
+        conn.exec_driver_sql('ALTER TABLE sections ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+
+# (version, description, step) in the order they must be applied. Never edit a
+# released entry; append a new one instead.
+MIGRATIONS = [
+    (1, 'Secondary indexes for hot foreign-key filters', create_indexes(
+        'ix_courses_prerequisite',
+        'ix_sections_course_number',
+        'ix_sections_instructor_name',
+        'ix_sections_year_semester',
+        ENROLLMENTS_STUDENT_SECTION_V1,
+        'ix_enrollments_section_identifier',
+    )),
+    (2, 'Search index: FTS5 on SQLite, pg_trgm on Postgres', create_search_index),
+    (3, 'Unique enrollments per student and section; section capacity and version',
+     add_registration_constraints),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Highest migration applied to the database, 0 if none"""
+    schema_version.create(conn, checkfirst=True)
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def applied_version(conn):
+    """current_version without creating the version table; 0 if it is missing"""
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade(engine, target=None):
+    """Create missing tables, then apply pending migrations up to `target`
+    (default: latest), one transaction each
+
+    Returns the list of (version, description) pairs that were applied.
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    with engine.begin() as conn:
+        db.metadata.create_all(conn)
+        version = current_version(conn)
+    for number, description, step in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        try:
+            with engine.begin() as conn:
+                step(conn)
+                conn.execute(schema_version.insert().values(version=number, description=description))
+        except IntegrityError as error:
+            raise RuntimeError(f'Migration {number} ({description}) failed, existing rows break a new '
+                               f'constraint: {error.orig}') from error
+        applied.append((number, description))
+    return applied
+
+
+class SchemaCheck:
+    """Boot-time check that the database has every migration this code expects
+
+    Nothing is queried at import. The server calls `verify()` once when it
+    boots (gunicorn.conf.py, or `python main.py`) and /readyz calls
+    `up_to_date()`. Once the database is current the answer is cached for
+    the life of the process, since versions only go up; until then each call
+    asks again, so a worker notices a `db-upgrade` run while it is serving.
+    SCHEMA_CHECK is 'warn' (default: log it) or 'strict' (refuse to boot).
+    """
+
+    def __init__(self, app=None):
+        self.version = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mode = app.config.get('SCHEMA_CHECK', 'warn')
+        if self.mode not in ('warn', 'strict'):
+            raise ValueError(f'Unknown SCHEMA_CHECK {self.mode!r}')
+        app.extensions['schema_check'] = self
+
+    def up_to_date(self):
+        if self.version is None or self.version < LATEST_VERSION:
+            with db.engine.connect() as conn:
+                self.version = applied_version(conn)
+        return self.version >= LATEST_VERSION
+
+    def verify(self):
+        if self.up_to_date():
+            return
+        message = (f'Database schema is at version {self.version}, this code expects {LATEST_VERSION}; '
+                   f'run `flask --app main db-upgrade`')
+        if self.mode == 'strict':
+            raise RuntimeError(message)
+        current_app.logger.warning(message)
+
+
+@click.command('db-upgrade')
+@click.option('--target', type=int, default=None, help='Stop after this migration version.')
+@with_appcontext
+def db_upgrade_command(target):
+    """Create missing tables and apply pending schema migrations."""
+    try:
+        applied = upgrade(db.engine, target)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+    for number, description in applied:
+        click.echo(f'Applied migration {number}: {description}')
+    if not applied:
+        click.echo('Database schema is up to date')
+
+
+@click.command('db-version')
+@with_appcontext
+def db_version_command():
+    """Show the schema migration version of the configured database."""
+    with db.engine.begin() as conn:
+        click.echo(f'Schema version {current_version(conn)} (latest {LATEST_VERSION})')
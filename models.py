@@ -0,0 +1,52 @@
+from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
+
+db = SQLAlchemy()
+
+class Student(db.Model):
+    __tablename__ = 'students'
+    student_number = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    dob = db.Column(db.Date, default=datetime.utcnow)
+
+class Course(db.Model):
+    __tablename__ = 'courses'
+    course_number = db.Column(db.Integer, primary_key=True)
+    course_name = db.Column(db.String(255), nullable=False)
+    credit_hours = db.Column(db.Integer)
+    prerequisite = db.Column(db.Integer, db.ForeignKey('courses.course_number'), index=True)
+
+class Instructor(db.Model):
+    __tablename__ = 'instructors'
+    instructor_name = db.Column(db.String(255), primary_key=True)
+
+class Section(db.Model):
+    __tablename__ = 'sections'
+    __table_args__ = (
+        db.Index('ix_sections_year_semester', 'year', 'semester'),
+    )
+    section_identifier = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    course_number = db.Column(db.Integer, db.ForeignKey('courses.course_number'), index=True)
+    instructor_name = db.Column(db.String(255), db.ForeignKey('instructors.instructor_name'), index=True)
+    semester = db.Column(db.String(50))
+    year = db.Column(db.Integer)
+    # Seats offered; NULL means no limit
+    capacity = db.Column(db.Integer)
+    # Bumped by every registration write and ORM update, so a registration
+    # worker can tell which of its cached seat counts to reread
+    version = db.Column(db.Integer, nullable=False, server_default='0')
+    enrollments = db.relationship('Enrollment', backref='related_section')
+    course = db.relationship('Course', backref='sections')
+    __mapper_args__ = {'version_id_col': version}
+
+class Enrollment(db.Model):
+    __tablename__ = 'enrollments'
+    __table_args__ = (
+        # Leading student_number column also serves plain per-student lookups
+        db.Index('ix_enrollments_student_section', 'student_number', 'section_identifier', unique=True),
+    )
+    enrollment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    student_number = db.Column(db.Integer, db.ForeignKey('students.student_number'))
+    section_identifier = db.Column(db.Integer, db.ForeignKey('sections.section_identifier'), index=True)
+    grade = db.Column(db.String(5))
+    section = db.relationship('Section', back_populates='enrollments', overlaps="related_section")
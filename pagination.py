@@ -0,0 +1,66 @@
+from flask import abort, render_template, request, stream_template
+from sqlalchemy import select
+from models import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows fetched from the cursor per round when streaming a full listing
+STREAM_BATCH_SIZE = 1000
+
+
+def page_size(args):
+    """Read ?limit= from the query string, clamped to a sane range"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_after(key_column, raw):
+    """Convert an ?after= token back to the key column's Python type"""
+    if raw is None or raw == '':
+        return None
+    try:
+        return key_column.type.python_type(raw)
+    except ValueError:
+        abort(400, f'Invalid after token: {raw!r}')
+
+
+def keyset_page(model, key_column, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Fetch one page ordered by `key_column`, starting strictly after `after`
+
+    Returns (items, next_after); next_after is None on the last page. One
+    extra row is fetched to know whether another page exists, so this is a
+    single statement regardless of table size or page depth.
+    """
+    stmt = select(model).order_by(key_column).limit(limit + 1)
+    if after is not None:
+        stmt = stmt.where(key_column > after)
+    items = db.session.execute(stmt).scalars().all()
+    next_after = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_after = getattr(items[-1], key_column.key)
+    return items, next_after
+
+
+def stream_all(model, key_column, batch_size=STREAM_BATCH_SIZE):
+    """Iterate over every row in key order, hydrating `batch_size` objects at a time"""
+    stmt = select(model).order_by(key_column).execution_options(yield_per=batch_size)
+    return db.session.execute(stmt).scalars()
+
+
+def render_listing(template, name, model, key_column):
+    """Render a listing page, either one keyset page or the whole table streamed
+
+    `?after=<key>&limit=<n>` selects a page; `?stream=1` streams every row
+    through the template without building the full list in memory.
+    """
+    if request.args.get('stream'):
+        rows = stream_all(model, key_column)
+        return stream_template(template, **{name: rows}, next_after=None)
+    limit = page_size(request.args)
+    after = parse_after(key_column, request.args.get('after'))
+    items, next_after = keyset_page(model, key_column, after, limit)
+    return render_template(template, **{name: items}, next_after=next_after, limit=limit)
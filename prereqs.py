@@ -0,0 +1,277 @@
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event, literal, select
+from models import db, Course
+
+# Recursive queries stop after this many hops so a cycle in the data can't run forever
+MAX_CTE_DEPTH = 1000
+DEFAULT_REFRESH_SECONDS = 60
+
+
+class PrerequisiteGraph:
+    """Immutable snapshot of the Course.prerequisite forest
+
+    Each course has at most one direct prerequisite, so the graph is a forest
+    plus, in bad data, some cycles and prerequisites naming courses that do
+    not exist. Those are listed in `dangling` as (course, missing id) pairs
+    and kept out of the graph; their courses start a tree of their own. Building it numbers every course by a
+    depth-first walk (entry/exit times), which makes "is A transitively
+    required by B" an O(1) interval check. Chains and unlock sets are O(k)
+    in the size of the answer.
+    """
+
+    def __init__(self, edges):
+        self.parent = {}
+        self.children = {}
+        for course, prerequisite in edges:
+            self.parent[course] = prerequisite
+            self.children.setdefault(course, [])
+        self.dangling = []
+        for course, prerequisite in self.parent.items():
+            if prerequisite in self.children:
+                self.children[prerequisite].append(course)
+            elif prerequisite is not None:
+                self.dangling.append((course, prerequisite))
+        self.dangling.sort()
+        for kids in self.children.values():
+            kids.sort()
+        self.depth = {}
+        self._enter = {}
+        self._exit = {}
+        self.order = []
+        roots = sorted(c for c in self.children if self.parent[c] not in self.children)
+        clock = 0
+        for root in roots:
+            self.depth[root] = 0
+            self._enter[root] = clock
+            clock += 1
+            stack = [(root, iter(self.children[root]))]
+            self.order.append(root)
+            while stack:
+                course, kids = stack[-1]
+                child = next(kids, None)
+                if child is None:
+                    self._exit[course] = clock
+                    clock += 1
+                    stack.pop()
+                    continue
+                self.depth[child] = self.depth[course] + 1
+                self._enter[child] = clock
+                clock += 1
+                self.order.append(child)
+                stack.append((child, iter(self.children[child])))
+        # Anything unreachable from a root sits on, or hangs off, a cycle
+        self.cyclic = sorted(set(self.children) - set(self.depth))
+        self.cycles = self._find_cycles()
+
+    def _find_cycles(self):
+        cycles = []
+        seen = set()
+        for start in self.cyclic:
+            path = []
+            position = {}
+            course = start
+            while course is not None and course not in seen and course not in position:
+                position[course] = len(path)
+                path.append(course)
+                course = self.parent.get(course)
+            if course in position:
+                cycles.append(path[position[course]:])
+            seen.update(path)
+        return cycles
+
+    def __contains__(self, course):
+        return course in self.children
+
+    def __len__(self):
+        return len(self.children)
+
+    def requires(self, course, prerequisite):
+        """True if `prerequisite` is somewhere in `course`'s prerequisite chain (O(1))"""
+        if course == prerequisite or course not in self._enter or prerequisite not in self._enter:
+            return False
+        return self._enter[prerequisite] < self._enter[course] and self._exit[course] < self._exit[prerequisite]
+
+    def ancestors(self, course):
+        """Prerequisite chain of `course`, nearest first"""
+        chain = []
+        seen = {course}
+        prerequisite = self.parent.get(course)
+        while prerequisite is not None and prerequisite not in seen:
+            chain.append(prerequisite)
+            seen.add(prerequisite)
+            prerequisite = self.parent.get(prerequisite)
+        return chain
+
+    def descendants(self, course):
+        """Every course that `course` unlocks, directly or transitively, breadth first"""
+        result = []
+        seen = {course}
+        frontier = [course]
+        while frontier:
+            following = []
+            for current in frontier:
+                for child in self.children.get(current, ()):
+                    if child not in seen:
+                        seen.add(child)
+                        result.append(child)
+                        following.append(child)
+            frontier = following
+        return result
+
+
+def load_graph():
+    """Build a PrerequisiteGraph from the courses table in a single query"""
+    rows = db.session.execute(select(Course.course_number, Course.prerequisite)).all()
+    return PrerequisiteGraph(rows)
+
+
+def ancestors_cte(course_number):
+    """Prerequisite chain via a recursive CTE, nearest first; used before the graph is built"""
+    chain = (
+        select(Course.prerequisite.label('course_number'), literal(1).label('depth'))
+        .where(Course.course_number == course_number, Course.prerequisite.isnot(None))
+        .cte('chain', recursive=True)
+    )
+    step = (
+        select(Course.prerequisite, chain.c.depth + 1)
+        .join(chain, Course.course_number == chain.c.course_number)
+        .where(Course.prerequisite.isnot(None), chain.c.depth < MAX_CTE_DEPTH)
+    )
+    chain = chain.union_all(step)
+    rows = db.session.execute(select(chain.c.course_number).order_by(chain.c.depth)).scalars()
+    result = []
+    seen = {course_number}
+    for course in rows:
+        if course in seen:
+            break
+        seen.add(course)
+        result.append(course)
+    return result
+
+
+def descendants_cte(course_number):
+    """Every course unlocked by `course_number` via a recursive CTE, breadth first"""
+    unlocked = (
+        select(Course.course_number, literal(1).label('depth'))
+        .where(Course.prerequisite == course_number)
+        .cte('unlocked', recursive=True)
+    )
+    step = (
+        select(Course.course_number, unlocked.c.depth + 1)
+        .join(unlocked, Course.prerequisite == unlocked.c.course_number)
+        .where(unlocked.c.depth < MAX_CTE_DEPTH)
+    )
+    unlocked = unlocked.union_all(step)
+    rows = db.session.execute(
+        select(unlocked.c.course_number).order_by(unlocked.c.depth, unlocked.c.course_number)).scalars()
+    result = []
+    seen = {course_number}
+    for course in rows:
+        if course not in seen:
+            seen.add(course)
+            result.append(course)
+    return result
+
+
+class PrerequisiteIndex:
+    """Keeps a PrerequisiteGraph per process, rebuilding it after course writes
+
+    The first lookup starts a background build and is answered with the
+    recursive CTE; lookups after that hit the in-memory graph. The graph is
+    marked stale when a commit touches a Course, and also rebuilt every
+    PREREQUISITE_GRAPH_REFRESH seconds to pick up writes from other workers.
+    """
+
+    def __init__(self, app=None):
+        self._graph = None
+        self._built_at = 0
+        self._stale = True
+        self._building = False
+        self._lock = threading.Lock()
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_seconds = app.config.get('PREREQUISITE_GRAPH_REFRESH', DEFAULT_REFRESH_SECONDS)
+        app.extensions['prerequisite_index'] = self
+
+    def invalidate(self):
+        self._stale = True
+
+    def rebuild(self):
+        """Build the graph synchronously in the current app context"""
+        # Cleared before loading so a commit landing mid-build marks the result stale again
+        self._stale = False
+        graph = load_graph()
+        with self._lock:
+            self._graph = graph
+            self._built_at = time.monotonic()
+        return graph
+
+    def graph(self, wait=False):
+        """Current graph, or None while a cold-start build is still running
+
+        A stale graph keeps serving while its replacement is built in the
+        background. With wait=True the graph is built inline when missing.
+        """
+        expired = time.monotonic() - self._built_at > self.refresh_seconds
+        if self._graph is None and wait:
+            return self.rebuild()
+        if (self._graph is None or self._stale or expired) and not self._building:
+            self._start_build(current_app._get_current_object())
+        return self._graph
+
+    def _start_build(self, app):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        def build():
+            try:
+                with app.app_context():
+                    self.rebuild()
+            finally:
+                self._building = False
+
+        threading.Thread(target=build, name='prerequisite-graph', daemon=True).start()
+
+    def ancestors(self, course_number):
+        """Prerequisite chain nearest first, or None if the course doesn't exist"""
+        graph = self.graph()
+        if graph is not None:
+            return graph.ancestors(course_number) if course_number in graph else None
+        if db.session.get(Course, course_number) is None:
+            return None
+        return ancestors_cte(course_number)
+
+    def descendants(self, course_number):
+        """Courses unlocked by `course_number`, or None if the course doesn't exist"""
+        graph = self.graph()
+        if graph is not None:
+            return graph.descendants(course_number) if course_number in graph else None
+        if db.session.get(Course, course_number) is None:
+            return None
+        return descendants_cte(course_number)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_course_writes(session, flush_context):
+    if any(isinstance(obj, Course) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info['prerequisite_graph_stale'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_graph(session):
+    if session.info.pop('prerequisite_graph_stale', False) and has_app_context():
+        index = current_app.extensions.get('prerequisite_index')
+        if index is not None:
+            index.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_course_writes(session):
+    session.info.pop('prerequisite_graph_stale', None)
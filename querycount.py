@@ -0,0 +1,120 @@
+import sys
+import click
+from contextlib import contextmanager
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from models import db, Student, Course, Instructor, Section
+
+# Maximum number of SQL statements each GET route may issue for one request.
+# A route that starts lazy-loading relationships per row blows straight past these.
+ROUTE_QUERY_BUDGETS = {
+    'index': 0,
+    'students_all': 1,
+    'student_detail': 2,
+    'instructor_detail': 2,
+    'courses_all': 1,
+    'course_detail': 2,
+    'instructors_all': 1,
+    'sections_all': 1,
+    'section_detail': 1,
+    'api.resource_collection': 1,
+    'api.resource_item': 1,
+    # One query per kind on the LIKE and trigram backends, plus backend detection on first use
+    'search': 4,
+    'search_suggest': 4,
+}
+DEFAULT_QUERY_BUDGET = 5
+
+# Routes that write to the database or otherwise shouldn't be replayed by the checker
+SKIP_ENDPOINTS = {'static', 'init_database_route'}
+
+
+class QueryCounter:
+    """Counts the SQL statements an engine executes while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with AssertionError if the wrapped block issues more than `limit` statements"""
+    with QueryCounter(engine or db.engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(f'  {i + 1}. {s}' for i, s in enumerate(counter.statements))
+        raise AssertionError(f'{counter.count} SQL statements issued, budget is {limit}:\n{listing}')
+
+
+def sample_route_args():
+    """Pick one existing key per table so parameterised routes can be exercised"""
+    course = {'course_id': db.session.query(Course.course_number).limit(1).scalar()}
+    return {
+        'student_detail': {'id': db.session.query(Student.student_number).limit(1).scalar()},
+        'instructor_detail': {'id': db.session.query(Instructor.instructor_name).limit(1).scalar()},
+        'course_detail': course,
+        'course_prerequisites': course,
+        'course_unlocks': course,
+        'section_detail': {'section_id': db.session.query(Section.section_identifier).limit(1).scalar()},
+        'api.resource_collection': {'resource': 'students'},
+        'api.resource_item': {'resource': 'students', 'id': db.session.query(Student.student_number).limit(1).scalar()},
+        'search': {'q': db.session.query(Student.name).limit(1).scalar()},
+        'search_suggest': {'q': db.session.query(Student.name).limit(1).scalar()},
+    }
+
+
+def check_route_budgets(app, budgets=None, default=DEFAULT_QUERY_BUDGET):
+    """Request every GET route once and return the ones that exceeded their budget
+
+    Returns a list of (endpoint, url, statement_count, budget) tuples; an empty
+    list means every route stayed within budget.
+    """
+    budgets = ROUTE_QUERY_BUDGETS if budgets is None else budgets
+    with app.app_context():
+        samples = sample_route_args()
+        engine = db.engine
+    client = app.test_client()
+    failures = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in SKIP_ENDPOINTS or 'GET' not in rule.methods:
+            continue
+        args = samples.get(rule.endpoint, {})
+        if set(rule.arguments) - set(args) or any(v is None for v in args.values()):
+            continue
+        with app.test_request_context():
+            url = url_for(rule.endpoint, **args)
+        with QueryCounter(engine) as counter:
+            client.get(url)
+        budget = budgets.get(rule.endpoint, default)
+        if counter.count > budget:
+            failures.append((rule.endpoint, url, counter.count, budget))
+    return failures
+
+
+@click.command('check-queries')
+@with_appcontext
+def check_queries_command():
+    """Fail if any route issues more SQL statements than its budget allows."""
+    failures = check_route_budgets(current_app._get_current_object())
+    for endpoint, url, count, budget in failures:
+        click.echo(f'{endpoint} ({url}): {count} statements, budget {budget}')
+    if failures:
+        sys.exit(1)
+    click.echo('All routes within their query budgets')
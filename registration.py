@@ -0,0 +1,396 @@
+import threading
+import time
+import click
+from flask import Blueprint, abort, current_app, request
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from models import db, Student, Section, Enrollment
+from analytics import GRADE_POINTS, SEMESTER_CODES, TERM_KEY
+from api import MAX_BATCH_IDS, api_error, json_response
+
+# Grades that complete a course as far as prerequisites are concerned
+PASSING_GRADES = [grade for grade, points in GRADE_POINTS if points > 0]
+DEFAULT_REFRESH_SECONDS = 300
+
+registrations = Blueprint('registrations', __name__)
+registrations.register_error_handler(HTTPException, api_error)
+
+
+class RegistrationConflict(Exception):
+    """A batch could not be committed because of writes made outside the engine"""
+
+
+def term_key(semester, year):
+    """Packed term key, the Python side of analytics.TERM_KEY"""
+    return (year or 0) * 10 + SEMESTER_CODES.get(semester, 0)
+
+
+def prerequisite_met(graph, course, completed):
+    """True if `course` has no prerequisite or `completed` covers it
+
+    The direct check is a set lookup. Failing that, passing any course
+    further down the chain counts too (a transfer credit for 301 covers
+    its prerequisite 201), at one O(1) interval check per completed course.
+    """
+    prerequisite = graph.parent.get(course)
+    if prerequisite is None or prerequisite in completed:
+        return True
+    return any(graph.requires(done, prerequisite) for done in completed)
+
+
+def lock_sections(conn, sections):
+    """Lock `sections` in key order and bump their versions, inside the caller's transaction
+
+    On SQLite this takes the database write lock. Returns {section:
+    (version, course, semester, year)} as of after the bump; deleted
+    sections are missing from it.
+    """
+    table = Section.__table__
+    conn.execute(select(table.c.section_identifier).where(table.c.section_identifier.in_(sections))
+                 .order_by(table.c.section_identifier).with_for_update()).all()
+    conn.execute(table.update().where(table.c.section_identifier.in_(sections))
+                 .values(version=table.c.version + 1))
+    return {section: (version, course, semester, year) for section, version, course, semester, year in conn.execute(
+        select(table.c.section_identifier, table.c.version, table.c.course_number, table.c.semester, table.c.year)
+        .where(table.c.section_identifier.in_(sections)))}
+
+
+def lock_students(conn, students):
+    conn.execute(select(Student.student_number).where(Student.student_number.in_(students))
+                 .order_by(Student.student_number).with_for_update()).all()
+
+
+class TermIndex:
+    """Registration state for one term, loaded in three queries
+
+    seats maps each of the term's sections to [course, capacity, taken,
+    version]; enrolled maps a student to {section: course} for the term;
+    completed maps a student to the courses they passed in earlier terms.
+    Only the RegistrationEngine that owns it touches it, under its lock.
+    """
+
+    def __init__(self, conn, semester, year):
+        self.semester = semester
+        self.year = year
+        self.loaded_at = time.monotonic()
+        sections = Section.__table__
+        self.seats = {
+            section: [course, capacity, 0, version]
+            for section, course, capacity, version in conn.execute(
+                select(sections.c.section_identifier, sections.c.course_number, sections.c.capacity,
+                       sections.c.version)
+                .where(sections.c.semester == semester, sections.c.year == year))
+        }
+        self.enrolled = self.load_students(conn)
+        for courses in self.enrolled.values():
+            for section in courses:
+                self.seats[section][2] += 1
+        self.completed = self.load_completed(conn)
+
+    def load_students(self, conn, students=None):
+        """{student: {section: course}} for this term, for `students` or everyone"""
+        stmt = (
+            select(Enrollment.student_number, Enrollment.section_identifier, Section.course_number)
+            .join(Section, Enrollment.section_identifier == Section.section_identifier)
+            .where(Section.semester == self.semester, Section.year == self.year)
+        )
+        if students is not None:
+            stmt = stmt.where(Enrollment.student_number.in_(students))
+        enrolled = {}
+        for student, section, course in conn.execute(stmt):
+            enrolled.setdefault(student, {})[section] = course
+        return enrolled
+
+    def load_completed(self, conn, students=None):
+        """{student: courses passed before this term}, for `students` or everyone"""
+        stmt = (
+            select(Enrollment.student_number, Section.course_number)
+            .join(Section, Enrollment.section_identifier == Section.section_identifier)
+            .where(TERM_KEY < term_key(self.semester, self.year),
+                   func.upper(func.trim(Enrollment.grade)).in_(PASSING_GRADES))
+        )
+        if students is not None:
+            stmt = stmt.where(Enrollment.student_number.in_(students))
+        completed = {}
+        for student, course in conn.execute(stmt):
+            completed.setdefault(student, set()).add(course)
+        return completed
+
+    def refresh(self, conn, sections):
+        """Reload the capacity and seats taken of `sections` from the database"""
+        table = Section.__table__
+        rows = conn.execute(
+            select(table.c.section_identifier, table.c.course_number, table.c.capacity, table.c.version,
+                   func.count(Enrollment.enrollment_id))
+            .outerjoin(Enrollment, Enrollment.section_identifier == table.c.section_identifier)
+            .where(table.c.section_identifier.in_(sections))
+            .group_by(table.c.section_identifier, table.c.course_number, table.c.capacity, table.c.version)
+        )
+        for section, course, capacity, version, taken in rows:
+            self.seats[section] = [course, capacity, taken, version]
+
+    def plan(self, graph, requests, indexes, reasons):
+        """Check `indexes` into `requests` in order, counting this batch's own earlier picks
+
+        Fills in `reasons` and returns (accepted indexes, {section: seats taken}).
+        """
+        taken = {}
+        picked = {}
+        accepted = []
+        for i in indexes:
+            student, section = requests[i]
+            course, capacity, count, _ = self.seats[section]
+            current = self.enrolled.get(student, {})
+            mine = picked.get(student, {})
+            if section in current or section in mine:
+                reason = 'already enrolled'
+            elif course is not None and (course in current.values() or course in mine.values()):
+                reason = 'already taking this course this term'
+            elif course is not None and course in self.completed.get(student, ()):
+                reason = 'already completed this course'
+            elif course is not None and not prerequisite_met(graph, course, self.completed.get(student, ())):
+                reason = 'missing prerequisite'
+            elif capacity is not None and count + taken.get(section, 0) >= capacity:
+                reason = 'section full'
+            else:
+                reason = None
+                taken[section] = taken.get(section, 0) + 1
+                mine[section] = course
+                picked[student] = mine
+                accepted.append(i)
+            reasons[i] = reason
+        return accepted, taken
+
+    def commit(self, conn, graph, requests, positions, reasons, locked):
+        """Check and write the requests at `positions` inside the caller's transaction
+
+        The caller has already locked every section of the batch with
+        lock_sections(), passing its result as `locked`, and then every
+        student with lock_students(). Sections whose version moved since
+        the index last saw them are reloaded, students are reloaded if
+        their enrollments for the term changed (for instance through
+        another worker), and their passed courses are reread. Only then is
+        the batch checked, so nothing can change under it before it
+        commits.
+
+        Returns (accepted indexes, {section: seats taken}) for apply()
+        once the transaction has committed; the number of stale sections
+        and students found is left in `self.reloaded`.
+        """
+        sections = sorted({requests[i][1] for i in positions})
+        versions = {}
+        moved = set()
+        for section in sections:
+            if section not in locked:
+                raise RegistrationConflict('Sections were deleted while the batch was being checked')
+            version, course, semester, year = locked[section]
+            if (semester, year) != (self.semester, self.year):
+                raise RegistrationConflict(f'Section {section} is no longer in {self.semester} {self.year}')
+            if section in self.seats and self.seats[section][0] != course:
+                # Same id, different course: the tables were recreated
+                moved.add(section)
+            versions[section] = version
+        stale = [section for section in sections if section in moved or section not in self.seats
+                 or versions[section] != self.seats[section][3] + 1]
+        if stale:
+            self.refresh(conn, stale)
+        for section in sections:
+            self.seats[section][3] = versions[section]
+
+        students = sorted({requests[i][0] for i in positions})
+        current = self.load_students(conn, students)
+        changed = [student for student in students if current.get(student, {}) != self.enrolled.get(student, {})]
+        for student in changed:
+            self.enrolled[student] = current.get(student, {})
+        # Grades are recorded without touching any section version, so
+        # passed courses are always reread for the locked students
+        completed = self.load_completed(conn, students)
+        for student in students:
+            self.completed[student] = completed.get(student, set())
+        self.reloaded = len(stale) + len(changed)
+
+        accepted, taken = self.plan(graph, requests, positions, reasons)
+        if accepted:
+            conn.execute(Enrollment.__table__.insert(), [
+                {'student_number': requests[i][0], 'section_identifier': requests[i][1]} for i in accepted
+            ])
+        return accepted, taken
+
+    def apply(self, requests, accepted, taken):
+        for section, count in taken.items():
+            self.seats[section][2] += count
+        for i in accepted:
+            student, section = requests[i]
+            self.enrolled.setdefault(student, {})[section] = self.seats[section][0]
+
+
+class RegistrationEngine:
+    """Validates and commits batches of enrollment requests
+
+    Checks run against an in-memory TermIndex per term, built on first use
+    and rebuilt every REGISTRATION_INDEX_REFRESH seconds. Sections carry a
+    version that every write bumps, so a worker only rereads the sections
+    and students another writer touched since its last batch, and it does
+    so while holding their row locks. Batches in one process run one at a
+    time.
+    """
+
+    def __init__(self, app=None):
+        self._terms = {}
+        self._section_terms = {}
+        self._lock = threading.Lock()
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        # Sections and students found stale and reloaded, across all batches
+        self.reloaded = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_seconds = app.config.get('REGISTRATION_INDEX_REFRESH', DEFAULT_REFRESH_SECONDS)
+        app.extensions['registration'] = self
+
+    def reset(self):
+        """Forget every term index and section, e.g. after the tables were dropped and recreated
+
+        Other workers notice a recreated database when a section they cached
+        has moved or disappeared, and otherwise within refresh_seconds.
+        """
+        with self._lock:
+            self._forget()
+
+    def _forget(self):
+        self._terms = {}
+        self._section_terms = {}
+
+    def _load_section_terms(self, conn):
+        table = Section.__table__
+        self._section_terms = {section: (semester, year) for section, semester, year in conn.execute(
+            select(table.c.section_identifier, table.c.semester, table.c.year))}
+
+    def _term_index(self, conn, term):
+        index = self._terms.get(term)
+        if index is None or time.monotonic() - index.loaded_at > self.refresh_seconds:
+            index = self._terms[term] = TermIndex(conn, *term)
+        return index
+
+    def register(self, requests):
+        """Enroll every (student_number, section_identifier) pair in `requests` that passes the checks
+
+        Returns one entry per request: None if it was enrolled, otherwise
+        the reason it was rejected. The whole batch commits in one
+        transaction: every section is locked first, in key order across
+        all its terms, then every student. Raises RegistrationConflict,
+        with nothing written, if a write outside the engine made the batch
+        fail or its sections were moved or deleted; the cached state is
+        dropped so a retry starts afresh.
+        """
+        graph = current_app.extensions['prerequisite_index'].graph(wait=True)
+        reasons = [None] * len(requests)
+        with self._lock, db.engine.connect() as conn:
+            students = set(conn.execute(select(Student.student_number).where(
+                Student.student_number.in_({student for student, _ in requests}))).scalars())
+            if any(section not in self._section_terms for _, section in requests):
+                # A section created since the last load
+                self._load_section_terms(conn)
+            by_term = {}
+            for i, (student, section) in enumerate(requests):
+                if student not in students:
+                    reasons[i] = 'unknown student'
+                elif section not in self._section_terms:
+                    reasons[i] = 'unknown section'
+                else:
+                    by_term.setdefault(self._section_terms[section], []).append(i)
+            indexes = {term: self._term_index(conn, term) for term in by_term}
+            conn.rollback()
+            if not by_term:
+                return reasons
+            queued = [requests[i] for positions in by_term.values() for i in positions]
+            results = {}
+            try:
+                with conn.begin():
+                    locked = lock_sections(conn, sorted({section for _, section in queued}))
+                    lock_students(conn, sorted({student for student, _ in queued}))
+                    for term, positions in by_term.items():
+                        results[term] = indexes[term].commit(conn, graph, requests, positions, reasons, locked)
+            except IntegrityError:
+                # An enrollment written without the locks; start afresh
+                self._forget()
+                raise RegistrationConflict('Enrollments changed outside registration; retry the batch')
+            except RegistrationConflict:
+                self._forget()
+                raise
+            stale = set()
+            for term, (accepted, taken) in results.items():
+                index = indexes[term]
+                self.reloaded += index.reloaded
+                index.apply(requests, accepted, taken)
+                stale |= {f'student:{requests[i][0]}' for i in accepted} | {f'section:{section}' for section in taken}
+            # Core inserts bypass the session events that keep the response cache fresh
+            cache = current_app.extensions.get('response_cache')
+            if cache is not None and stale:
+                cache.invalidate(stale | {'enrollments'})
+        return reasons
+
+
+@registrations.route('/api/v1/registrations', methods=['POST'])
+def register_batch():
+    """Enroll a batch: {"enrollments": [{"student_number": ..., "section_identifier": ...}, ...]}
+
+    Requests are checked in order and each one stands alone: the valid
+    ones are committed, together, and the rest come back with a reason.
+    A 409 means nothing was written.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('enrollments'), list):
+        abort(400, 'Expected a JSON object with an "enrollments" list')
+    if len(body['enrollments']) > MAX_BATCH_IDS:
+        abort(413, f'At most {MAX_BATCH_IDS} enrollments per request')
+    requests = []
+    for item in body['enrollments']:
+        try:
+            requests.append((int(item['student_number']), int(item['section_identifier'])))
+        except (KeyError, TypeError, ValueError):
+            abort(400, f'Invalid enrollment {item!r}')
+    try:
+        reasons = current_app.extensions['registration'].register(requests)
+    except RegistrationConflict as error:
+        abort(409, str(error))
+    rejected = [
+        {'index': i, 'student_number': student, 'section_identifier': section, 'reason': reason}
+        for i, ((student, section), reason) in enumerate(zip(requests, reasons)) if reason is not None
+    ]
+    return json_response({'enrolled': len(requests) - len(rejected), 'rejected': rejected})
+
+
+@click.command('set-capacity')
+@click.argument('capacity')
+@click.option('--section', 'sections', type=int, multiple=True, help='Section to change; repeat for several.')
+@click.option('--semester', help='Change every section of this term; needs --year.')
+@click.option('--year', type=int)
+@with_appcontext
+def set_capacity_command(capacity, sections, semester, year):
+    """Set the seats offered by sections; CAPACITY is a number, or 'none' for no limit."""
+    if capacity.lower() == 'none':
+        seats = None
+    elif capacity.isdigit():
+        seats = int(capacity)
+    else:
+        raise click.BadParameter('expected a number of seats or "none"', param_hint='CAPACITY')
+    if not sections and not (semester and year):
+        raise click.UsageError('Pass --section, or --semester with --year')
+    stmt = select(Section)
+    if sections:
+        stmt = stmt.where(Section.section_identifier.in_(sections))
+    if semester and year:
+        stmt = stmt.where(Section.semester == semester, Section.year == year)
+    found = db.session.execute(stmt).scalars().all()
+    missing = set(sections) - {section.section_identifier for section in found}
+    if missing:
+        raise click.ClickException(f'Unknown sections: {", ".join(map(str, sorted(missing)))}')
+    for section in found:
+        section.capacity = seats
+    # The ORM bumps each version, so registration workers reread these seats on their next batch
+    db.session.commit()
+    click.echo(f'Set the capacity of {len(found)} sections to {"no limit" if seats is None else seats}')
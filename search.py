@@ -0,0 +1,534 @@
+import gc
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+import click
+from flask import abort, current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, inspect
+from sqlalchemy.exc import OperationalError
+from models import db, Student, Course, Instructor
+
+# kind -> (model, key column, searchable text column)
+SOURCES = {
+    'student': (Student, Student.student_number, Student.name),
+    'course': (Course, Course.course_number, Course.course_name),
+    'instructor': (Instructor, Instructor.instructor_name, Instructor.instructor_name),
+}
+BACKENDS = ('fts5', 'trigram', 'memory', 'like')
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+DEFAULT_REFRESH_SECONDS = 300
+# Matches considered when ranking FTS5 results
+RANK_CANDIDATES = 500
+
+# SQLite: one row per searchable record, mirrored into an external-content
+# FTS5 table by triggers. Prefix indexes on 2 and 3 characters keep
+# typeahead queries on short prefixes from scanning the whole term list.
+FTS_TABLES = [
+    'CREATE TABLE search_documents (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, '
+    'key TEXT NOT NULL, text TEXT NOT NULL, UNIQUE (kind, key))',
+    "CREATE VIRTUAL TABLE search_fts USING fts5(text, content='search_documents', content_rowid='id', "
+    "prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+]
+FTS_TRIGGERS = [
+    'CREATE TRIGGER search_documents_ai AFTER INSERT ON search_documents BEGIN '
+    'INSERT INTO search_fts (rowid, text) VALUES (new.id, new.text); END',
+    'CREATE TRIGGER search_documents_ad AFTER DELETE ON search_documents BEGIN '
+    "INSERT INTO search_fts (search_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    'CREATE TRIGGER search_documents_au AFTER UPDATE ON search_documents BEGIN '
+    "INSERT INTO search_fts (search_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    'INSERT INTO search_fts (rowid, text) VALUES (new.id, new.text); END',
+]
+FTS_UPSERT = ('INSERT INTO search_documents (kind, key, text) VALUES (?, ?, ?) '
+              'ON CONFLICT (kind, key) DO UPDATE SET text = excluded.text')
+FTS_DELETE = 'DELETE FROM search_documents WHERE kind = ? AND key = ?'
+
+# Postgres: trigram GIN indexes on the source columns themselves, which the
+# database keeps up to date, so there is nothing to maintain from Python.
+TRIGRAM_INDEXES = [
+    ('ix_students_name_trgm', 'students', 'name'),
+    ('ix_courses_course_name_trgm', 'courses', 'course_name'),
+    ('ix_instructors_instructor_name_trgm', 'instructors', 'instructor_name'),
+]
+
+
+def fold(value):
+    """Lower-case and strip accents, so 'José' and 'jose' match"""
+    if value.isascii():
+        return value.lower()
+    decomposed = unicodedata.normalize('NFKD', value.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(value):
+    return re.findall(r'\w+', fold(value or ''))
+
+
+def search_limit(args, default=DEFAULT_LIMIT):
+    """Read ?limit= from the query string, clamped to 1..MAX_LIMIT"""
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        abort(400, f'Invalid limit: {args.get("limit")!r}')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _result(kind, key, text):
+    return {'kind': kind, 'key': key if kind == 'instructor' else int(key), 'text': text}
+
+
+def _kinds(kind):
+    return [kind] if kind is not None else list(SOURCES)
+
+
+class PrefixIndex:
+    """In-process word-prefix index: postings behind a sorted token list
+
+    Bisecting into the sorted distinct tokens finds every token that starts
+    with a prefix, which gives trie lookups without a node per character.
+    Postings are insertion-ordered dicts used as sets, so a query can stop
+    as soon as it has `limit` matches. Used when the database has neither
+    FTS5 nor pg_trgm.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self._words = {}
+        self._postings = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def load(self, documents):
+        """Bulk-add (kind, key, text) triples to an empty index; much faster than add()"""
+        with self._lock:
+            for kind, key, text in documents:
+                doc = (kind, key)
+                self.documents[doc] = text
+                words = self._words[doc] = tuple(dict.fromkeys(tokenize(text)))
+                for token in words:
+                    posting = self._postings.get(token)
+                    if posting is None:
+                        posting = self._postings[token] = {}
+                    posting[doc] = None
+            self._tokens = sorted(self._postings)
+
+    def add(self, kind, key, text):
+        doc = (kind, key)
+        with self._lock:
+            self._remove(doc)
+            self.documents[doc] = text
+            words = self._words[doc] = tuple(dict.fromkeys(tokenize(text)))
+            for token in words:
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    insort(self._tokens, token)
+                posting[doc] = None
+
+    def remove(self, kind, key):
+        with self._lock:
+            self._remove((kind, key))
+
+    def _remove(self, doc):
+        if self.documents.pop(doc, None) is None:
+            return
+        for token in self._words.pop(doc):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(doc, None)
+            if not posting:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def _matching(self, prefix):
+        """Tokens starting with `prefix`, shortest (an exact match) first"""
+        tokens = self._tokens
+        i = bisect_left(tokens, prefix)
+        while i < len(tokens) and tokens[i].startswith(prefix):
+            yield tokens[i]
+            i += 1
+
+    def search(self, terms, kind=None, limit=DEFAULT_LIMIT):
+        """Documents with a word starting with every term
+
+        Candidates come from the most selective term and are checked against
+        the others. Exact word matches come ahead of longer completions, and
+        otherwise results are in the order documents were indexed.
+        """
+        if not terms:
+            return []
+        with self._lock:
+            sizes = [(sum(len(self._postings[t]) for t in self._matching(term)), term) for term in terms]
+            _, driver = min(sizes)
+            others = [term for term in terms if term != driver]
+            results = []
+            for token in self._matching(driver):
+                for doc in self._postings[token]:
+                    if (kind is None or doc[0] == kind) and self._matches(doc, others):
+                        results.append(doc)
+                        if len(results) >= limit:
+                            return [doc + (self.documents[doc],) for doc in results]
+            return [doc + (self.documents[doc],) for doc in results]
+
+    def _matches(self, doc, terms):
+        words = self._words[doc]
+        return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def fts5_available(conn):
+    try:
+        conn.exec_driver_sql('CREATE VIRTUAL TABLE temp.search_fts_probe USING fts5(text)')
+    except OperationalError:
+        return False
+    conn.exec_driver_sql('DROP TABLE temp.search_fts_probe')
+    return True
+
+
+def build_fts_index(conn):
+    """(Re)create the SQLite FTS5 tables and fill them from the source tables
+
+    Triggers are added after the bulk fill; FTS5's 'rebuild' command indexes
+    the whole content table far faster than one trigger call per row.
+    """
+    conn.exec_driver_sql('DROP TABLE IF EXISTS search_fts')
+    conn.exec_driver_sql('DROP TABLE IF EXISTS search_documents')
+    for statement in FTS_TABLES:
+        conn.exec_driver_sql(statement)
+    for kind, (model, key, column) in SOURCES.items():
+        conn.exec_driver_sql(
+            f'INSERT INTO search_documents (kind, key, text) '
+            f"SELECT '{kind}', CAST({key.name} AS TEXT), {column.name} FROM {model.__tablename__} "
+            f'WHERE {column.name} IS NOT NULL'
+        )
+    conn.exec_driver_sql("INSERT INTO search_fts (search_fts) VALUES ('rebuild')")
+    for statement in FTS_TRIGGERS:
+        conn.exec_driver_sql(statement)
+
+
+def create_trigram_indexes(conn):
+    conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)')
+
+
+def create_search_index(conn):
+    """Migration step: FTS5 tables on SQLite, trigram indexes on Postgres, nothing elsewhere"""
+    if conn.dialect.name == 'sqlite' and fts5_available(conn):
+        build_fts_index(conn)
+    elif conn.dialect.name == 'postgresql':
+        create_trigram_indexes(conn)
+
+
+def relevance(terms, text):
+    """Sort key: more terms matching a whole word first, then shorter text"""
+    words = tokenize(text)
+    return -sum(term in words for term in terms), len(text), text
+
+
+def fts_search(terms, kind=None, limit=DEFAULT_LIMIT, ranked=True):
+    """FTS5 MATCH on word prefixes
+
+    Unranked queries stop at `limit` matches, which keeps typeahead on a
+    one- or two-letter prefix fast even when it matches most of the table.
+    Ranked queries sort the first RANK_CANDIDATES matches by relevance().
+    FTS5's own bm25 rank has to score every match, which costs tens of
+    milliseconds for a common first name at a million students, and on
+    two- or three-word names it mostly measures how rare a word is anyway.
+    """
+    match = ' '.join(f'"{term}"*' for term in terms)
+    sql = ('SELECT d.kind, d.key, d.text FROM search_fts JOIN search_documents d ON d.id = search_fts.rowid '
+           'WHERE search_fts MATCH ?')
+    params = [match]
+    if kind is not None:
+        sql += ' AND d.kind = ?'
+        params.append(kind)
+    sql += ' LIMIT ?'
+    params.append(RANK_CANDIDATES if ranked else limit)
+    rows = db.session.connection().exec_driver_sql(sql, tuple(params)).all()
+    if ranked:
+        rows = sorted(rows, key=lambda row: relevance(terms, row[2]))[:limit]
+    return rows
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def trigram_search(terms, kind=None, limit=DEFAULT_LIMIT, ranked=True):
+    """ILIKE substring match served by the pg_trgm GIN indexes, best similarity first"""
+    query = ' '.join(terms)
+    rows = []
+    for name in _kinds(kind):
+        _, key, column = SOURCES[name]
+        similarity = func.similarity(column, query)
+        stmt = (db.select(key, column, similarity)
+                .where(*[column.ilike(_like_pattern(term), escape='\\') for term in terms])
+                .limit(limit))
+        if ranked:
+            stmt = stmt.order_by(similarity.desc())
+        rows.extend((name, k, text, score) for k, text, score in db.session.execute(stmt))
+    if ranked:
+        rows.sort(key=lambda row: -row[3])
+    return [row[:3] for row in rows[:limit]]
+
+
+def like_search(terms, kind=None, limit=DEFAULT_LIMIT, ranked=True):
+    """Plain LOWER(column) LIKE '%term%' scans; the baseline every other backend beats"""
+    rows = []
+    for name in _kinds(kind):
+        _, key, column = SOURCES[name]
+        stmt = (db.select(key, column)
+                .where(*[func.lower(column).like(_like_pattern(term), escape='\\') for term in terms])
+                .limit(limit - len(rows)))
+        rows.extend((name, k, text) for k, text in db.session.execute(stmt))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def load_prefix_index():
+    index = PrefixIndex()
+    # Millions of small long-lived tuples set off a full cyclic GC pass over
+    # and over; pausing it cuts a million-row build from ~30s to ~6s
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        index.load(
+            (kind, k, text)
+            for kind, (_, key, column) in SOURCES.items()
+            for k, text in db.session.execute(db.select(key, column).where(column.isnot(None))).yield_per(10000)
+        )
+    finally:
+        if enabled:
+            gc.enable()
+    return index
+
+
+def _changes(session):
+    """(kind, key, text) upserts and (kind, key, None) removals from a flush
+
+    Uses attribute history, so renaming a primary key drops the old entry,
+    and records whose searchable text didn't change are skipped.
+    """
+    changes = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for kind, (model, key, column) in SOURCES.items():
+            if isinstance(obj, model):
+                break
+        else:
+            continue
+        state = inspect(obj)
+        key_history = state.attrs[key.key].history
+        text_history = state.attrs[column.key].history
+        if obj in session.dirty and not (key_history.has_changes() or text_history.has_changes()):
+            continue
+        for old_key in key_history.deleted:
+            if old_key is not None:
+                changes.append((kind, old_key, None))
+        current = getattr(obj, key.key)
+        if obj in session.deleted:
+            changes.append((kind, current, None))
+        elif getattr(obj, column.key) is not None:
+            changes.append((kind, current, getattr(obj, column.key)))
+    return changes
+
+
+class SearchIndex:
+    """Search over student names, course names and instructor names
+
+    SEARCH_BACKEND picks the implementation; 'auto' (default) uses FTS5 on
+    SQLite once `flask db-upgrade` has built the index, pg_trgm on Postgres,
+    and otherwise an in-process PrefixIndex. The FTS5 tables are updated in
+    the same transaction as the rows they mirror; the in-process index is
+    updated after commit and fully reloaded every SEARCH_INDEX_REFRESH
+    seconds to pick up writes from other workers.
+    """
+
+    def __init__(self, app=None):
+        self.configured = 'auto'
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        self._backend = None
+        # True while 'auto' settled on 'memory' only because migrations are pending
+        self._provisional = False
+        self._prefix_index = None
+        self._built_at = 0
+        self._building = False
+        self._pending = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configured = app.config.get('SEARCH_BACKEND', 'auto')
+        if self.configured not in BACKENDS + ('auto',):
+            raise ValueError(f'Unknown SEARCH_BACKEND {self.configured!r}')
+        self.refresh_seconds = app.config.get('SEARCH_INDEX_REFRESH', DEFAULT_REFRESH_SECONDS)
+        app.extensions['search_index'] = self
+
+    def backend(self, conn=None):
+        """Name of the backend in use, resolved against the database
+
+        With 'auto', a SQLite database still waiting for migration 2 gets
+        'memory' for now and is asked again on later calls, so a worker
+        started before `flask db-upgrade` switches to FTS5, and starts
+        writing search_documents, once the schema is current.
+        """
+        if self._provisional and self._schema_current():
+            self._backend = None
+        if self._backend is None:
+            self._backend = self.configured
+            self._provisional = False
+            if self.configured == 'auto':
+                conn = conn or db.session.connection()
+                if conn.dialect.name == 'postgresql':
+                    self._backend = 'trigram'
+                elif conn.dialect.name == 'sqlite' and conn.exec_driver_sql(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_documents'").first():
+                    self._backend = 'fts5'
+                else:
+                    self._backend = 'memory'
+                    self._provisional = conn.dialect.name == 'sqlite' and not self._schema_current()
+        return self._backend
+
+    @staticmethod
+    def _schema_current():
+        schema_check = current_app.extensions.get('schema_check')
+        return schema_check is None or schema_check.up_to_date()
+
+    def search(self, query, kind=None, limit=DEFAULT_LIMIT, ranked=True):
+        """Up to `limit` {'kind', 'key', 'text'} matches for every word of `query`"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        backend = self.backend()
+        if backend == 'fts5':
+            rows = fts_search(terms, kind, limit, ranked)
+        elif backend == 'trigram':
+            rows = trigram_search(terms, kind, limit, ranked)
+        elif backend == 'memory' and self.prefix_index() is not None:
+            rows = self._prefix_index.search(terms, kind, limit)
+        else:
+            rows = like_search(terms, kind, limit)
+        return [_result(*row) for row in rows]
+
+    def rebuild(self):
+        """Rebuild the index from the source tables, after bulk loads or /init_db
+
+        On SQLite this also creates the FTS5 tables if they are missing.
+        Returns the name of the backend now in use.
+        """
+        with db.engine.begin() as conn:
+            if self.configured in ('auto', 'fts5') and conn.dialect.name == 'sqlite' and fts5_available(conn):
+                build_fts_index(conn)
+        self._backend = None
+        self._provisional = False
+        backend = self.backend()
+        if backend == 'memory':
+            self._load_prefix_index()
+        return backend
+
+    def prefix_index(self):
+        """The in-process index, or None while its first build is still running"""
+        expired = time.monotonic() - self._built_at > self.refresh_seconds
+        if (self._prefix_index is None or expired) and not self._building:
+            self._start_build(current_app._get_current_object())
+        return self._prefix_index
+
+    def _load_prefix_index(self):
+        with self._lock:
+            self._pending = []
+        index = load_prefix_index()
+        with self._lock:
+            # Replay commits that landed while the snapshot was being read
+            for change in self._pending:
+                self._apply(index, change)
+            self._pending = []
+            self._prefix_index = index
+            self._built_at = time.monotonic()
+
+    def _start_build(self, app):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        def build():
+            try:
+                with app.app_context():
+                    self._load_prefix_index()
+            finally:
+                self._building = False
+
+        threading.Thread(target=build, name='search-index', daemon=True).start()
+
+    @staticmethod
+    def _apply(index, change):
+        kind, key, text = change
+        if text is None:
+            index.remove(kind, key)
+        else:
+            index.add(kind, key, text)
+
+    def apply(self, changes):
+        """Apply committed changes to the in-process index"""
+        with self._lock:
+            if self._building:
+                self._pending.extend(changes)
+            index = self._prefix_index
+        if index is not None:
+            for change in changes:
+                self._apply(index, change)
+
+
+def _search_index():
+    return current_app.extensions.get('search_index') if has_app_context() else None
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+    index = _search_index()
+    if index is None:
+        return
+    changes = _changes(session)
+    if not changes:
+        return
+    if index.backend(session.connection()) == 'fts5':
+        # Written inside the flush's transaction, so the index commits or rolls back with the rows
+        conn = session.connection()
+        for kind, key, text in changes:
+            if text is None:
+                conn.exec_driver_sql(FTS_DELETE, (kind, str(key)))
+            else:
+                conn.exec_driver_sql(FTS_UPSERT, (kind, str(key), text))
+    else:
+        session.info.setdefault('search_changes', []).extend(changes)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_search_changes(session):
+    changes = session.info.pop('search_changes', None)
+    index = _search_index()
+    if changes and index is not None and index.backend() == 'memory':
+        index.apply(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop('search_changes', None)
+
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex_command():
+    """Rebuild the search index from the students, courses and instructors tables."""
+    started = time.perf_counter()
+    backend = current_app.extensions['search_index'].rebuild()
+    click.echo(f'Rebuilt {backend} search index in {time.perf_counter() - started:.2f}s')
@@ -22,6 +22,8 @@ CREATE TABLE Sections (
     instructor_name VARCHAR(255),
     semester VARCHAR(50),
     year INT,
+    capacity INT,
+    version INT NOT NULL DEFAULT 0,
     FOREIGN KEY (course_number) REFERENCES Courses(course_number),
     FOREIGN KEY (instructor_name) REFERENCES Instructors(instructor_name)
 );
@@ -35,6 +37,14 @@ CREATE TABLE Enrollments (
     FOREIGN KEY (section_identifier) REFERENCES Sections(section_identifier)
 );
 
+-- Secondary indexes for the foreign-key filters used by the detail pages
+CREATE INDEX ix_courses_prerequisite ON Courses (prerequisite);
+CREATE INDEX ix_sections_course_number ON Sections (course_number);
+CREATE INDEX ix_sections_instructor_name ON Sections (instructor_name);
+CREATE INDEX ix_sections_year_semester ON Sections (year, semester);
+CREATE UNIQUE INDEX ix_enrollments_student_section ON Enrollments (student_number, section_identifier);
+CREATE INDEX ix_enrollments_section_identifier ON Enrollments (section_identifier);
+
 
 
 
@@ -0,0 +1,33 @@
+from sqlalchemy import select
+from models import db, Course, Section, Enrollment
+from analytics import TERM_KEY
+
+# Every column the transcript table shows, fetched in one statement so the
+# template never has to walk enrollment -> section -> course lazily.
+TRANSCRIPT_COLUMNS = (
+    Enrollment.section_identifier,
+    Enrollment.grade,
+    Section.course_number,
+    Section.instructor_name,
+    Section.semester,
+    Section.year,
+    Course.course_name,
+    Course.credit_hours,
+)
+
+
+def transcript_query(student_number):
+    """Build the flat SELECT for one student's transcript"""
+    return (
+        select(*TRANSCRIPT_COLUMNS)
+        .join(Section, Enrollment.section_identifier == Section.section_identifier)
+        .join(Course, Section.course_number == Course.course_number)
+        .where(Enrollment.student_number == student_number)
+        # Chronological: Spring, Summer, Fall rather than the semester names' alphabetical order
+        .order_by(TERM_KEY, Enrollment.section_identifier)
+    )
+
+
+def student_transcript(student_number):
+    """Return the transcript rows for a student as named tuples"""
+    return db.session.execute(transcript_query(student_number)).all()
@@ -0,0 +1,361 @@
+import csv
+import importlib.util
+import sys
+import time
+from itertools import islice
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, select
+from models import db, Student, Course, Section, Enrollment
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Rows per validate/upsert round. Each round looks up existing enrollments
+# with one IN query over the chunk's students, which must stay under
+# SQLite's limit on bound parameters.
+DEFAULT_CHUNK_SIZE = 10000
+EXPORT_CHUNK_SIZE = 50000
+
+REQUIRED_COLUMNS = ('student_number', 'section_identifier')
+MAX_GRADE_LENGTH = Enrollment.__table__.c.grade.type.length
+
+# One row per enrollment, with the student, section and course it refers to
+EXPORT_COLUMNS = [
+    Enrollment.enrollment_id,
+    Enrollment.student_number,
+    Student.name.label('student_name'),
+    Enrollment.section_identifier,
+    Section.course_number,
+    Course.course_name,
+    Course.credit_hours,
+    Section.semester,
+    Section.year,
+    Section.instructor_name,
+    Enrollment.grade,
+]
+EXPORT_FORMATS = ('csv', 'parquet')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KiB everywhere else
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class KeySets:
+    """Every student, section and course key, loaded once so rows validate without queries
+
+    A million students cost a few tens of MiB as a set of ints, far less
+    than a lookup per row.
+    """
+
+    def __init__(self):
+        self.students = set(db.session.execute(select(Student.student_number)).scalars())
+        self.sections = dict(db.session.execute(select(Section.section_identifier, Section.course_number)).all())
+        self.courses = set(db.session.execute(select(Course.course_number)).scalars())
+
+    def validate(self, student, section, course, grade):
+        """Rejection reason for one parsed row, or None if it can be imported"""
+        if student is None:
+            return 'invalid student_number'
+        if student not in self.students:
+            return 'unknown student'
+        if section is None:
+            return 'invalid section_identifier'
+        if section not in self.sections:
+            return 'unknown section'
+        if course is not None:
+            if course not in self.courses:
+                return 'unknown course'
+            if self.sections[section] != course:
+                return 'section belongs to a different course'
+        if grade is not None and len(grade) > MAX_GRADE_LENGTH:
+            return 'grade too long'
+        return None
+
+
+class RejectWriter:
+    """Writes rejected rows with their line number and reason; the file is only created on the first one"""
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, line, reason, row):
+        if self.path is None:
+            self.count += 1
+            return
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['line', 'reason'] + self.header)
+        self._writer.writerow([line, reason] + row)
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def upsert_enrollments(conn, records, overwrite_grades=False):
+    """Insert or update {(student, section): grade}; returns (inserted, updated)
+
+    Existing enrollments for the chunk's students come back in one query
+    through ix_enrollments_student_section, then updates and inserts each
+    go out as a single executemany. A None grade leaves an existing
+    enrollment's grade alone unless `overwrite_grades` is set.
+    """
+    table = Enrollment.__table__
+    existing = {}
+    stmt = (select(table.c.enrollment_id, table.c.student_number, table.c.section_identifier)
+            .where(table.c.student_number.in_({student for student, _ in records})))
+    for enrollment_id, student, section in conn.execute(stmt):
+        existing.setdefault((student, section), enrollment_id)
+    updates = []
+    inserts = []
+    for (student, section), grade in records.items():
+        enrollment_id = existing.get((student, section))
+        if enrollment_id is None:
+            inserts.append({'student_number': student, 'section_identifier': section, 'grade': grade})
+        elif grade is not None or overwrite_grades:
+            updates.append({'id': enrollment_id, 'new_grade': grade})
+    if updates:
+        conn.execute(table.update().where(table.c.enrollment_id == bindparam('id'))
+                     .values(grade=bindparam('new_grade')), updates)
+    if inserts:
+        conn.execute(table.insert(), inserts)
+        # New seats taken: make the registration engine reload these sections
+        sections = Section.__table__
+        conn.execute(sections.update()
+                     .where(sections.c.section_identifier.in_({row['section_identifier'] for row in inserts}))
+                     .values(version=sections.c.version + 1))
+    return len(inserts), len(updates)
+
+
+def import_enrollments(engine, source, rejects_path=None, chunk_size=DEFAULT_CHUNK_SIZE, report=None,
+                       overwrite_grades=False):
+    """Stream enrollments from CSV file object `source` into the database
+
+    Needs student_number and section_identifier columns; grade and
+    course_number are optional, and a course_number is checked against the
+    section's course. A row repeating an enrollment already in the database
+    (or earlier in the file) updates its grade if the row has one; a
+    missing or blank grade only clears it with `overwrite_grades`. Each
+    chunk is committed on its own, so memory stays flat however long the
+    file is.
+
+    Returns a dict of row counts and elapsed seconds. `report(stats)` is
+    called after every chunk.
+    """
+    started = time.perf_counter()
+    reader = csv.reader(source)
+    header = next(reader, None) or []
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f'Missing required column(s): {", ".join(missing)}')
+    student_at = header.index('student_number')
+    section_at = header.index('section_identifier')
+    grade_at = header.index('grade') if 'grade' in header else None
+    course_at = header.index('course_number') if 'course_number' in header else None
+
+    keys = KeySets()
+    rejects = RejectWriter(rejects_path, header)
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'seconds': 0.0}
+    try:
+        while True:
+            first_line = reader.line_num + 1
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                break
+            records = {}
+            for offset, row in enumerate(chunk):
+                if len(row) != len(header):
+                    rejects.write(first_line + offset, 'wrong number of columns', row)
+                    continue
+                student = _int(row[student_at])
+                section = _int(row[section_at])
+                grade = (row[grade_at].strip() or None) if grade_at is not None else None
+                course = None
+                if course_at is not None and row[course_at].strip():
+                    course = _int(row[course_at])
+                    if course is None:
+                        rejects.write(first_line + offset, 'invalid course_number', row)
+                        continue
+                reason = keys.validate(student, section, course, grade)
+                if reason is not None:
+                    rejects.write(first_line + offset, reason, row)
+                    continue
+                records[(student, section)] = grade
+            if records:
+                with engine.begin() as conn:
+                    inserted, updated = upsert_enrollments(conn, records, overwrite_grades)
+                stats['inserted'] += inserted
+                stats['updated'] += updated
+            stats['rows'] += len(chunk)
+            stats['rejected'] = rejects.count
+            stats['seconds'] = time.perf_counter() - started
+            if report:
+                report(stats)
+    finally:
+        rejects.close()
+    return stats
+
+
+def export_query(semester=None, year=None):
+    """Joined enrollment rows in enrollment_id order; outer joins keep orphaned enrollments"""
+    stmt = (
+        select(*EXPORT_COLUMNS)
+        .select_from(Enrollment)
+        .outerjoin(Student, Enrollment.student_number == Student.student_number)
+        .outerjoin(Section, Enrollment.section_identifier == Section.section_identifier)
+        .outerjoin(Course, Section.course_number == Course.course_number)
+        .order_by(Enrollment.enrollment_id)
+    )
+    if semester is not None:
+        stmt = stmt.where(Section.semester == semester)
+    if year is not None:
+        stmt = stmt.where(Section.year == year)
+    return stmt
+
+
+def _partitions(stmt, chunk_size):
+    """Result rows `chunk_size` at a time; yield_per streams from a server-side cursor where there is one"""
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    return result.keys(), result.partitions()
+
+
+def export_csv(out, stmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write the rows of `stmt` to text file `out` as CSV; returns the row count"""
+    names, partitions = _partitions(stmt, chunk_size)
+    writer = csv.writer(out)
+    writer.writerow(list(names))
+    count = 0
+    for partition in partitions:
+        writer.writerows(partition)
+        count += len(partition)
+    return count
+
+
+def parquet_available():
+    """pyarrow is optional, and slow to import, so it is only loaded for a Parquet export"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _arrow_type(pyarrow, column):
+    python_type = column.type.python_type
+    if python_type is int:
+        return pyarrow.int64()
+    if python_type is float:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def export_parquet(path, stmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write the rows of `stmt` to a Parquet file, one row group per chunk; returns the row count"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)') from None
+    schema = pyarrow.schema([(column.name, _arrow_type(pyarrow, column)) for column in stmt.selected_columns])
+    _, partitions = _partitions(stmt, chunk_size)
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for partition in partitions:
+            columns = list(zip(*partition))
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema))
+            count += len(partition)
+    return count
+
+
+def _open(path, mode):
+    """Open a CSV file for the csv module, with '-' meaning stdin or stdout"""
+    if path == '-':
+        return click.get_text_stream('stdin' if mode == 'r' else 'stdout')
+    return open(path, mode, newline='')
+
+
+def _throughput(rows, seconds):
+    peak = peak_rss_mb()
+    memory = f', peak RSS {peak:,.0f} MiB' if peak is not None else ''
+    return f'{rows:,} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec{memory})'
+
+
+@click.command('import-enrollments')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--rejects', 'rejects_path', default=None,
+              help='Where to write rejected rows.  [default: PATH.rejects.csv]')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows per upsert batch.')
+@click.option('--overwrite-grades', is_flag=True,
+              help='Clear existing grades where the file has no grade, instead of keeping them.')
+@click.option('--quiet', is_flag=True, help='Only print the final summary.')
+@with_appcontext
+def import_enrollments_command(path, rejects_path, chunk_size, overwrite_grades, quiet):
+    """Upsert enrollments from a CSV file, validating every key in memory."""
+    if rejects_path is None:
+        rejects_path = 'rejects.csv' if path == '-' else f'{path}.rejects.csv'
+
+    def report(stats):
+        if not quiet:
+            click.echo(f'{stats["rows"]:>12,} rows read, {stats["rejected"]:,} rejected', err=True)
+
+    with _open(path, 'r') as source:
+        try:
+            stats = import_enrollments(db.engine, source, rejects_path, chunk_size, report, overwrite_grades)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+    # Writes went around the ORM, so the session events never saw them.
+    # This also empties the store gunicorn workers share under 'auto'
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.clear()
+    click.echo(f'Imported {_throughput(stats["rows"], stats["seconds"])}: '
+               f'{stats["inserted"]:,} inserted, {stats["updated"]:,} updated, {stats["rejected"]:,} rejected')
+    if stats['rejected']:
+        click.echo(f'Rejected rows written to {rejects_path}')
+
+
+@click.command('export-enrollments')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(EXPORT_FORMATS), default=None,
+              help='Output format.  [default: from the file extension, else csv]')
+@click.option('--semester', default=None, help='Only export this semester, e.g. Fall.')
+@click.option('--year', type=int, default=None, help='Only export this year.')
+@click.option('--chunk-size', default=EXPORT_CHUNK_SIZE, show_default=True, help='Rows fetched per round.')
+@with_appcontext
+def export_enrollments_command(path, file_format, semester, year, chunk_size):
+    """Stream enrollments joined with their student, section and course to CSV or Parquet."""
+    if file_format is None:
+        file_format = 'parquet' if path.endswith('.parquet') else 'csv'
+    started = time.perf_counter()
+    stmt = export_query(semester, year)
+    if file_format == 'parquet':
+        if path == '-':
+            raise click.ClickException('Parquet output needs a file path')
+        try:
+            count = export_parquet(path, stmt, chunk_size)
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+    else:
+        with _open(path, 'w') as out:
+            count = export_csv(out, stmt, chunk_size)
+    click.echo(f'Exported {_throughput(count, time.perf_counter() - started)}', err=True)